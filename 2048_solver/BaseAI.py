@@ -1,3 +1,6 @@
 class BaseAI:
     def getMove(self, grid):
         pass
+
+    def close(self):
+        pass
@@ -4,3 +4,6 @@ class BaseDisplayer:
 
     def display(self, grid):
         pass
+
+    def close(self):
+        pass
@@ -0,0 +1,240 @@
+import argparse
+import random
+import time
+from collections import Counter
+
+import numpy as np
+
+from BitGrid import MOVES, ROW_MASK, ROW_EMPTY, ROW_MAX, SPREAD, maxExponent
+from Evaluation import TableEvaluator, ROW_TABLE, COL_TABLE, BONUS_EXPONENT, CORNER_SHIFT
+from IntelligentAgent import MOVE_ORDER, SEARCH_MODES
+
+# Lockstep runner: plays many games in one process and advances all of them
+# one move at a time. For every move the search tree of each active game is
+# expanded to a fixed depth, the leaves of all trees are gathered into one
+# NumPy array and scored in a single vectorized call, and the values are then
+# backed up tree by tree. Without a deadline there is no alpha-beta cutoff,
+# so every tree is searched in full.
+#
+# The same games can be played one after another with every leaf scored on
+# its own by TableEvaluator, the way a GameManager game does, which gives the
+# baseline for the throughput comparison.
+
+ROW_SHIFTS = (0, 16, 32, 48)
+# EMPTY_SHIFTS[row] are the nibble shifts of the empty cells of a packed row
+EMPTY_SHIFTS = tuple(tuple(4 * y for y in cells) for cells in ROW_EMPTY)
+WIN_EXPONENT = 11
+
+
+class BatchEvaluator:
+    """
+        Vectorized TableEvaluator: scores an array of packed boards with the
+        same line tables and weights, so the results are identical.
+    """
+    def __init__(self, evaluator=None):
+        self.evaluator = evaluator or TableEvaluator()
+        self.row_table = np.array(ROW_TABLE, dtype=np.int64)
+        self.col_table = np.array(COL_TABLE, dtype=np.int64)
+        self.row_max = np.array(ROW_MAX, dtype=np.int64)
+        self.spread = np.array(SPREAD, dtype=np.uint64)
+
+    def evaluate(self, boards):
+        """ Returns a float64 array with the score of every board in a uint64 array """
+        mask = np.uint64(ROW_MASK)
+        lanes = [((boards >> np.uint64(shift)) & mask).astype(np.intp) for shift in ROW_SHIFTS]
+        rows = sum(self.row_table[lane] for lane in lanes)
+
+        spread = self.spread
+        t = (spread[lanes[0]] | (spread[lanes[1]] << np.uint64(4))
+             | (spread[lanes[2]] << np.uint64(8)) | (spread[lanes[3]] << np.uint64(12)))
+        cols = sum(self.col_table[((t >> np.uint64(shift)) & mask).astype(np.intp)] for shift in ROW_SHIFTS)
+
+        mono = -np.minimum(rows & 0xFF, (rows >> 8) & 0xFF) - np.minimum(cols & 0xFF, (cols >> 8) & 0xFF)
+        top = np.maximum.reduce([self.row_max[lane] for lane in lanes])
+        on_edge = (((boards >> np.uint64(CORNER_SHIFT)) & np.uint64(0xF)).astype(np.int64) == top).astype(np.int64)
+        bonus = np.where(top == BONUS_EXPONENT, 100, 0)
+
+        monotonicity, edge, free_cells, bonus_weight = self.evaluator.weights()
+        return monotonicity*mono + edge*on_edge + free_cells*(rows >> 16) + bonus_weight*bonus
+
+
+class BatchGame:
+    """ State of one game: packed board, its own random numbers and statistics """
+    def __init__(self, seed, probability=0.9):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.probability = probability
+        self.board = 0
+        self.moves = 0
+        self.spawned_fours = 0
+        self.over = False
+        self.spawn()
+        self.spawn()
+
+    def spawn(self):
+        """ Places a tile on a random empty cell, as ComputerAI and GameManager do """
+        board = self.board
+        empty = [shift + col for shift in ROW_SHIFTS for col in EMPTY_SHIFTS[(board >> shift) & ROW_MASK]]
+        shift = self.rng.choice(empty)
+        exponent = 1 if self.rng.random() < self.probability else 2
+        self.spawned_fours += exponent == 2
+        self.board = board | (exponent << shift)
+
+    def play(self, move):
+        self.board = MOVES[move](self.board)
+        self.moves += 1
+        if maxExponent(self.board) >= WIN_EXPONENT:
+            self.over = True
+        else:
+            self.spawn()
+
+    def max_tile(self):
+        return 1 << maxExponent(self.board)
+
+    def score(self):
+        """ Same as GameManager.getScore """
+        score = 0
+        for shift in range(0, 64, 4):
+            exponent = (self.board >> shift) & 0xF
+            if exponent:
+                score += (exponent - 1) << exponent
+        return score - 4 * self.spawned_fours
+
+
+def expand(board, depth, leaves):
+    """
+    Expands the player node of board to depth plies. Leaves are appended to
+    leaves and show up in the tree as their index there.
+    :return leaf index, or [(move, [(two tile child, four tile child), ...]), ...]
+    """
+    if depth == 0:
+        leaves.append(board)
+        return len(leaves) - 1
+
+    children = []
+    for move in MOVE_ORDER:
+        moved = MOVES[move](board)
+        if moved == board:
+            continue
+        if depth == 1:
+            leaves.append(moved)
+            children.append((move, len(leaves) - 1))
+            continue
+        spawns = []
+        for row_shift in ROW_SHIFTS:
+            for col_shift in EMPTY_SHIFTS[(moved >> row_shift) & ROW_MASK]:
+                shift = row_shift + col_shift
+                spawns.append((expand(moved | (1 << shift), depth - 2, leaves),
+                               expand(moved | (2 << shift), depth - 2, leaves)))
+        children.append((move, spawns))
+
+    if not children:
+        leaves.append(board)
+        return len(leaves) - 1
+    return children
+
+
+def backup(node, values, mode, probability):
+    """ Value of a player node with the leaf scores in values. :return (best move, value) """
+    if isinstance(node, int):
+        return None, values[node]
+
+    best_move, best_util = None, -100000
+    for move, spawns in node:
+        if isinstance(spawns, int):
+            util = values[spawns]
+        elif mode == "expectimax":
+            util = sum(probability * backup(two, values, mode, probability)[1]
+                       + (1 - probability) * backup(four, values, mode, probability)[1]
+                       for two, four in spawns) / len(spawns)
+        else:
+            # spawn_value of the minimax agent: the worst 2 and the worst 4
+            util = (.9*min(backup(two, values, mode, probability)[1] for two, four in spawns)
+                    + .1*min(backup(four, values, mode, probability)[1] for two, four in spawns))
+        if util > best_util:
+            best_move, best_util = move, util
+    return best_move, best_util
+
+
+def run_games(games, seed=0, depth=3, mode="minimax", lockstep=True, evaluator=None, probability=0.9):
+    """
+    Plays games seeded seed, seed + 1, ... with a fixed depth search.
+    :param depth->int : Plies searched, counted like IntelligentAgent's max_depth
+    :param lockstep->bool : Advance all games together and score leaves in NumPy batches,
+                            otherwise play the games one after another and score leaves one by one
+    :return (list of BatchGame, statistics dict)
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError("Unknown search mode: " + str(mode))
+    evaluator = evaluator or TableEvaluator()
+    batch_evaluator = BatchEvaluator(evaluator)
+    played = [BatchGame(seed + i, probability) for i in range(games)]
+    leaf_count = 0
+    batches = 0
+
+    start = time.perf_counter()
+    if lockstep:
+        active = [game for game in played if not game.over]
+        while active:
+            leaves = []
+            trees = [expand(game.board, depth, leaves) for game in active]
+            values = batch_evaluator.evaluate(np.array(leaves, dtype=np.uint64)).tolist()
+            leaf_count += len(leaves)
+            batches += 1
+
+            for game, tree in zip(active, trees):
+                move, util = backup(tree, values, mode, probability)
+                if move is None:
+                    game.over = True
+                else:
+                    game.play(move)
+            active = [game for game in active if not game.over]
+    else:
+        for game in played:
+            while not game.over:
+                leaves = []
+                tree = expand(game.board, depth, leaves)
+                values = [evaluator.evaluate(board) for board in leaves]
+                leaf_count += len(leaves)
+                move, util = backup(tree, values, mode, probability)
+                if move is None:
+                    game.over = True
+                else:
+                    game.play(move)
+    elapsed = time.perf_counter() - start
+
+    return played, {
+        "games": games,
+        "lockstep": lockstep,
+        "elapsed": elapsed,
+        "games_per_second": games / elapsed,
+        "leaf_evaluations": leaf_count,
+        "leaf_evaluations_per_second": leaf_count / elapsed,
+        "mean_batch": leaf_count / batches if batches else 1.0,
+        "max_tile_distribution": dict(sorted(Counter(game.max_tile() for game in played).items())),
+        "score_mean": sum(game.score() for game in played) / games,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play 2048 games in lockstep with batched leaf evaluation")
+    parser.add_argument("-n", "--games", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--mode", choices=SEARCH_MODES, default="minimax")
+    args = parser.parse_args()
+
+    results = {}
+    for lockstep in (False, True):
+        played, stats = run_games(args.games, args.seed, args.depth, args.mode, lockstep)
+        results[lockstep] = [(game.moves, game.board) for game in played]
+        print("%-11s %7.2f games/s %10.0f leaf evals/s  mean batch %7.0f  mean score %8.0f  tiles %s"
+              % ("lockstep" if lockstep else "sequential", stats["games_per_second"],
+                 stats["leaf_evaluations_per_second"], stats["mean_batch"], stats["score_mean"],
+                 stats["max_tile_distribution"]))
+
+    print("Same games: %s" % (results[False] == results[True]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+from BaseDisplayer import BaseDisplayer
+from BitGrid import BitGrid, randomGrids, unpackMap
+from ComputerAI import ComputerAI
+from GameManager import GameManager
+from Grid import Grid, vecIndex
+from IntelligentAgent import IntelligentAgent
+
+# Deterministic benchmark suite for the 2048 solver. Micro benchmarks time
+# the grid operations, the leaf evaluation and a fixed depth search over a
+# fixed corpus of positions; the macro benchmark plays seeded games with a
+# fixed depth agent, so every run does exactly the same work. Every timing is
+# the best of a few repeats. Results can be saved as a baseline and later
+# runs compared against it: a metric that got worse by more than the
+# threshold is a regression, and changed node counts or game results are
+# reported as changed behaviour.
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_positions.txt")
+CORPUS_SEED = 2048
+CORPUS_SIZE = 200
+SEARCH_POSITIONS = 30
+SEARCH_DEPTH = 5
+GAME_SEEDS = (0, 1, 2)
+GAME_DEPTH = 3
+# Passes over the corpus per timed micro benchmark, so one sample takes tens of milliseconds
+MICRO_LOOPS = 20
+
+
+class FixedDepthAgent(IntelligentAgent):
+    """ Searches every move to the same depth, so games do not depend on the clock """
+    def __init__(self, depth=GAME_DEPTH, **agent_kwargs):
+        super().__init__(**agent_kwargs)
+        self.depth = depth
+        self.clock = time.perf_counter
+
+    def getMove(self, grid):
+        if grid.getMaxTile() == 2048:
+            return 0
+        self.deadline = float("inf")
+        self.pv_move = None
+        self.afterstates.clear()
+        if self.orderer:
+            self.orderer.new_search()
+
+        best_move = None
+        for self.max_depth in range(1, self.depth + 1, 2):
+            best_move, util = self.search_once(grid)
+            self.pv_move = best_move
+        return best_move
+
+
+def make_corpus(path=CORPUS_PATH):
+    """ Writes the position corpus, one packed board in hex per line """
+    grids = [grid for grid in randomGrids(BitGrid, 25 * CORPUS_SIZE, CORPUS_SEED)[::25] if grid.canMove()]
+    with open(path, "w") as corpusFile:
+        for grid in grids:
+            corpusFile.write("%016x\n" % grid.board)
+
+
+def load_corpus(path=CORPUS_PATH):
+    """ Returns the corpus boards as (list of Grid, list of BitGrid) """
+    with open(path) as corpusFile:
+        boards = [int(line, 16) for line in corpusFile if line.strip()]
+    grids, bitGrids = [], []
+    for board in boards:
+        grid = Grid()
+        grid.map = unpackMap(board)
+        bitGrid = BitGrid()
+        bitGrid.board = board
+        grids.append(grid)
+        bitGrids.append(bitGrid)
+    return grids, bitGrids
+
+
+def best_time(function, repeat):
+    """ Best wall time of repeat calls of function """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _moves(grids):
+    for _ in range(MICRO_LOOPS):
+        for grid in grids:
+            for direction in vecIndex:
+                grid.clone().move(direction)
+
+
+def _can_move(grids):
+    for _ in range(MICRO_LOOPS):
+        for grid in grids:
+            for direction in vecIndex:
+                grid.canMove([direction])
+
+
+def _available_moves(grids):
+    for _ in range(MICRO_LOOPS):
+        for grid in grids:
+            grid.getAvailableMoves()
+
+
+def run_suite(repeat=5):
+    """ Runs every benchmark and returns {"metrics": ..., "checks": ...} """
+    grids, bitGrids = load_corpus()
+    metrics = {}
+
+    def record(name, value, unit, higher_is_better=True):
+        metrics[name] = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+    for label, corpus in (("grid", grids), ("bitgrid", bitGrids)):
+        calls = MICRO_LOOPS * len(corpus)
+        record(label + "_move", 4 * calls / best_time(lambda: _moves(corpus), repeat), "moves/s")
+        record(label + "_can_move", 4 * calls / best_time(lambda: _can_move(corpus), repeat), "calls/s")
+        record(label + "_available_moves", calls / best_time(lambda: _available_moves(corpus), repeat), "calls/s")
+
+    agent = IntelligentAgent()
+    for label, corpus in (("grid", grids), ("bitgrid", bitGrids)):
+        states = [(0, grid) for grid in corpus]
+
+        def evaluate():
+            for _ in range(MICRO_LOOPS):
+                for state in states:
+                    agent.evaluate_state(state)
+
+        record(label + "_evaluate_state", 1e6 * best_time(evaluate, repeat) / (MICRO_LOOPS * len(states)), "us/call",
+               higher_is_better=False)
+
+    # Fixed depth search with a fresh agent per position, so the node count is exact
+    positions = bitGrids[:SEARCH_POSITIONS]
+    nodes = [0]
+
+    def search():
+        nodes[0] = 0
+        for grid in positions:
+            searcher = FixedDepthAgent(SEARCH_DEPTH)
+            searcher.getMove(grid)
+            nodes[0] += searcher.nodes
+
+    elapsed = best_time(search, repeat)
+    record("search_nodes_per_second", nodes[0] / elapsed, "nodes/s")
+
+    games = []
+
+    def play():
+        games.clear()
+        for seed in GAME_SEEDS:
+            manager = GameManager(4, FixedDepthAgent(GAME_DEPTH), ComputerAI(seed + 1000), BaseDisplayer(), BitGrid,
+                                  verbose=False, seed=seed)
+            maxTile = manager.start()
+            games.append({"seed": seed, "max_tile": maxTile, "score": manager.getScore(), "moves": manager.moves})
+
+    # Games take long enough that a single run is stable
+    elapsed = best_time(play, 1)
+    record("games_per_second", len(GAME_SEEDS) / elapsed, "games/s")
+    record("game_moves_per_second", sum(game["moves"] for game in games) / elapsed, "moves/s")
+
+    return {
+        "python": platform.python_version(),
+        "metrics": metrics,
+        "checks": {"search_nodes": nodes[0], "games": games},
+    }
+
+
+def compare(baseline, current, threshold):
+    """
+    Prints every metric next to its baseline.
+    :return list of names of metrics that regressed by more than threshold
+    """
+    regressions = []
+    for name, metric in current["metrics"].items():
+        base = baseline["metrics"].get(name)
+        if base is None:
+            print("%-28s %14.2f %-8s (new)" % (name, metric["value"], metric["unit"]))
+            continue
+        change = (metric["value"] - base["value"]) / base["value"] if base["value"] else 0.0
+        worse = -change if metric["higher_is_better"] else change
+        flag = "REGRESSION" if worse > threshold else ""
+        if flag:
+            regressions.append(name)
+        print("%-28s %14.2f %-8s baseline %14.2f  %+6.1f%% %s"
+              % (name, metric["value"], metric["unit"], base["value"], 100 * change, flag))
+
+    for name, value in current["checks"].items():
+        if baseline["checks"].get(name) != value:
+            print("Behaviour changed: %s differs from the baseline" % name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic 2048 benchmarks with baseline comparison")
+    parser.add_argument("--save", help="store the results as a baseline JSON file")
+    parser.add_argument("--compare", help="compare against a baseline JSON file")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative slowdown, 0.1 = 10%%")
+    parser.add_argument("--repeat", type=int, default=5, help="timings are the best of this many runs")
+    parser.add_argument("--make-corpus", action="store_true", help="regenerate the position corpus")
+    args = parser.parse_args()
+
+    if args.make_corpus or not os.path.exists(CORPUS_PATH):
+        make_corpus()
+
+    results = run_suite(args.repeat)
+    if args.save:
+        with open(args.save, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as input_file:
+            baseline = json.load(input_file)
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print("%d regression(s) beyond %.0f%%: %s" % (len(regressions), 100 * args.threshold,
+                                                        ", ".join(regressions)))
+            sys.exit(1)
+    else:
+        for name, metric in results["metrics"].items():
+            print("%-28s %14.2f %s" % (name, metric["value"], metric["unit"]))
+        print("search nodes: %d, games: %s" % (results["checks"]["search_nodes"], results["checks"]["games"]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,404 @@
+import random
+import time
+
+from Grid import Grid, vecIndex, UP, DOWN, LEFT, RIGHT
+
+# Bitboard backend for 2048. The 4x4 board is packed into a single 64-bit
+# integer of log2 nibbles: cell (x, y) lives in bits 4 * (4 * x + y), so row x
+# is the 16-bit lane starting at bit 16 * x and an empty cell is nibble 0.
+# Every row move is a lookup in a precomputed 65536-entry table.
+
+ROW_MASK = 0xFFFF
+COL_MASK = 0x000F000F000F000F
+MAX_EXPONENT = 15   # Largest tile a nibble can hold is 2^15 = 32768
+
+
+def reverseRow(row: int) -> int:
+    """ Reverses the order of the four nibbles in a row """
+    return (row >> 12) | ((row >> 4) & 0x00F0) | ((row << 4) & 0x0F00) | ((row << 12) & 0xF000)
+
+
+def unpackCol(row: int) -> int:
+    """ Spreads the four nibbles of a row down the first column of a board """
+    return (row | (row << 12) | (row << 24) | (row << 36)) & COL_MASK
+
+
+def transpose(board: int) -> int:
+    """ Swaps rows and columns of a packed board """
+    a1 = board & 0xF0F00F0FF0F00F0F
+    a2 = board & 0x0000F0F00000F0F0
+    a3 = board & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+
+class MergeOverflow:
+    """
+        Move table entry of a row whose move merges two 32768 tiles, which
+        would need a sixteenth exponent. Every operation a move does with a
+        table entry raises on it, so all move paths refuse such a merge
+        without a check per move.
+    """
+    __slots__ = ()
+
+    def _raise(self, *args):
+        raise OverflowError("Merging two 32768 tiles needs a larger tile than a BitGrid holds")
+
+    __lshift__ = __xor__ = __rxor__ = __or__ = __ror__ = _raise
+
+
+MERGE_OVERFLOW = MergeOverflow()
+
+
+def moveRowLeft(row: int) -> int:
+    """
+    Slides and merges a packed row towards nibble 0, the same way Grid.merge does.
+    :return the moved row, or None if it merges two 32768 tiles
+    """
+    tiles = [(row >> (4 * i)) & 0xF for i in range(4)]
+    tiles = [tile for tile in tiles if tile]
+
+    merged = []
+    i = 0
+    while i < len(tiles):
+        if i + 1 < len(tiles) and tiles[i] == tiles[i + 1]:
+            if tiles[i] == MAX_EXPONENT:
+                return None
+            merged.append(tiles[i] + 1)
+            i += 2
+        else:
+            merged.append(tiles[i])
+            i += 1
+
+    result = 0
+    for i, tile in enumerate(merged):
+        result |= tile << (4 * i)
+    return result
+
+
+def _buildTables():
+    rowLeft, rowRight, colUp, colDown = [], [], [], []
+    rowMax, rowEmpty, spread = [], [], []
+
+    for row in range(1 << 16):
+        left = moveRowLeft(row)
+        right = moveRowLeft(reverseRow(row))
+
+        # Tables hold the xor delta so a move is board ^ delta for every lane
+        if left is None:
+            rowLeft.append(MERGE_OVERFLOW)
+            colUp.append(MERGE_OVERFLOW)
+        else:
+            rowLeft.append(row ^ left)
+            colUp.append(unpackCol(row) ^ unpackCol(left))
+        if right is None:
+            rowRight.append(MERGE_OVERFLOW)
+            colDown.append(MERGE_OVERFLOW)
+        else:
+            right = reverseRow(right)
+            rowRight.append(row ^ right)
+            colDown.append(unpackCol(row) ^ unpackCol(right))
+        spread.append(unpackCol(row))
+
+        cells = [(row >> (4 * i)) & 0xF for i in range(4)]
+        rowMax.append(max(cells))
+        rowEmpty.append(tuple(i for i in range(4) if cells[i] == 0))
+
+    return rowLeft, rowRight, colUp, colDown, rowMax, rowEmpty, spread
+
+
+ROW_LEFT, ROW_RIGHT, COL_UP, COL_DOWN, ROW_MAX, ROW_EMPTY, SPREAD = _buildTables()
+
+
+def moveLeft(board: int) -> int:
+    return (board
+            ^ ROW_LEFT[board & ROW_MASK]
+            ^ (ROW_LEFT[(board >> 16) & ROW_MASK] << 16)
+            ^ (ROW_LEFT[(board >> 32) & ROW_MASK] << 32)
+            ^ (ROW_LEFT[(board >> 48) & ROW_MASK] << 48))
+
+
+def moveRight(board: int) -> int:
+    return (board
+            ^ ROW_RIGHT[board & ROW_MASK]
+            ^ (ROW_RIGHT[(board >> 16) & ROW_MASK] << 16)
+            ^ (ROW_RIGHT[(board >> 32) & ROW_MASK] << 32)
+            ^ (ROW_RIGHT[(board >> 48) & ROW_MASK] << 48))
+
+
+# Up and down moves transpose the board inline by spreading each row into a column
+def moveUp(board: int) -> int:
+    t = (SPREAD[board & ROW_MASK] | (SPREAD[(board >> 16) & ROW_MASK] << 4)
+         | (SPREAD[(board >> 32) & ROW_MASK] << 8) | (SPREAD[(board >> 48) & ROW_MASK] << 12))
+    return (board
+            ^ COL_UP[t & ROW_MASK]
+            ^ (COL_UP[(t >> 16) & ROW_MASK] << 4)
+            ^ (COL_UP[(t >> 32) & ROW_MASK] << 8)
+            ^ (COL_UP[(t >> 48) & ROW_MASK] << 12))
+
+
+def moveDown(board: int) -> int:
+    t = (SPREAD[board & ROW_MASK] | (SPREAD[(board >> 16) & ROW_MASK] << 4)
+         | (SPREAD[(board >> 32) & ROW_MASK] << 8) | (SPREAD[(board >> 48) & ROW_MASK] << 12))
+    return (board
+            ^ COL_DOWN[t & ROW_MASK]
+            ^ (COL_DOWN[(t >> 16) & ROW_MASK] << 4)
+            ^ (COL_DOWN[(t >> 32) & ROW_MASK] << 8)
+            ^ (COL_DOWN[(t >> 48) & ROW_MASK] << 12))
+
+
+# Indexed by the direction constants UP, DOWN, LEFT, RIGHT from Grid
+MOVES = (moveUp, moveDown, moveLeft, moveRight)
+
+
+def moveBoard(board: int, direction: int) -> int:
+    """ Returns the packed board after moving in direction """
+    return MOVES[direction](board)
+
+
+def countEmpty(board: int) -> int:
+    """ Returns the number of empty cells on a packed board """
+    return (len(ROW_EMPTY[board & ROW_MASK]) + len(ROW_EMPTY[(board >> 16) & ROW_MASK])
+            + len(ROW_EMPTY[(board >> 32) & ROW_MASK]) + len(ROW_EMPTY[(board >> 48) & ROW_MASK]))
+
+
+def maxExponent(board: int) -> int:
+    """ Returns the log2 of the largest tile on a packed board """
+    return max(ROW_MAX[board & ROW_MASK], ROW_MAX[(board >> 16) & ROW_MASK],
+               ROW_MAX[(board >> 32) & ROW_MASK], ROW_MAX[(board >> 48) & ROW_MASK])
+
+
+def packMap(gridMap) -> int:
+    """ Packs a list of lists of tile values into a board """
+    board = 0
+    for x in range(4):
+        for y in range(4):
+            value = gridMap[x][y]
+            if value:
+                board |= (value.bit_length() - 1) << (4 * (4 * x + y))
+    return board
+
+
+def unpackMap(board: int) -> list:
+    """ Unpacks a board into a list of lists of tile values """
+    gridMap = []
+    for x in range(4):
+        row = []
+        for y in range(4):
+            exponent = (board >> (4 * (4 * x + y))) & 0xF
+            row.append(1 << exponent if exponent else 0)
+        gridMap.append(row)
+    return gridMap
+
+
+class MapRow(list):
+    """ Row of BitGrid.map that writes assigned cells back to the board """
+    __slots__ = ("grid", "x")
+
+    def __init__(self, grid, x: int, values):
+        super().__init__(values)
+        self.grid = grid
+        self.x = x
+
+    def __setitem__(self, y, value) -> None:
+        super().__setitem__(y, value)
+        for col in range(4):
+            self.grid.setCellValue((self.x, col), self[col])
+
+
+class MapView(list):
+    """ List of lists view of a BitGrid, assignments to grid.map[x][y] update the board """
+    __slots__ = ("grid",)
+
+    def __init__(self, grid):
+        super().__init__(MapRow(grid, x, row) for x, row in enumerate(unpackMap(grid.board)))
+        self.grid = grid
+
+    def __setitem__(self, x, row) -> None:
+        super().__setitem__(x, row)
+        for x in range(4):
+            for y in range(4):
+                self.grid.setCellValue((x, y), self[x][y])
+
+
+def toBoard(grid) -> int:
+    """ Returns the packed board of a BitGrid or a list backed Grid """
+    return grid.board if isinstance(grid, BitGrid) else packMap(grid.map)
+
+
+class BitGrid:
+    """
+        Drop-in replacement for Grid backed by a packed 64-bit board.
+        Only 4x4 boards with tiles up to 32768 are supported.
+    """
+    __slots__ = ("size", "board")
+
+    def __init__(self, size: int=4):
+        if size != 4:
+            raise ValueError("BitGrid only supports 4x4 boards")
+        self.size  = size
+        self.board = 0
+
+    @property
+    def map(self) -> list:
+        """ List of lists view of the board, cell assignments write through to it like on Grid """
+        return MapView(self)
+
+    @map.setter
+    def map(self, gridMap) -> None:
+        self.board = packMap(gridMap)
+
+    def clone(self):
+        """ Returns a new BitGrid with the same board """
+        gridCopy = BitGrid.__new__(BitGrid)
+        gridCopy.size  = self.size
+        gridCopy.board = self.board
+
+        return gridCopy
+
+    def hashKey(self) -> int:
+        """ Returns a hashable key identifying the board """
+        return self.board
+
+    def canInsert(self, pos: tuple) -> bool:
+        return self.getCellValue(pos) == 0
+
+    def insertTile(self, pos: tuple, value: int) -> None:
+        if self.canInsert(pos):
+            self.setCellValue(pos, value)
+
+    def crossBound(self, pos: tuple) -> bool:
+        """ Returns True if position is within the board"""
+        return 0 <= pos[0] < self.size and 0 <= pos[1] < self.size
+
+    def setCellValue(self, pos: tuple, value: int) -> None:
+        """ Set the value of cell at position pos to value """
+        if self.crossBound(pos):
+            shift    = 4 * (4 * pos[0] + pos[1])
+            exponent = value.bit_length() - 1 if value else 0
+            self.board = (self.board & ~(0xF << shift)) | (exponent << shift)
+
+    def getCellValue(self, pos: tuple):
+        """ Return the value at pos if valid """
+        if not self.crossBound(pos):
+            return None
+
+        exponent = (self.board >> (4 * (4 * pos[0] + pos[1]))) & 0xF
+        return 1 << exponent if exponent else 0
+
+    def getAvailableCells(self) -> list:
+        """ Returns a list of empty cells """
+        board = self.board
+        return [(x, y)
+                for x in range(4)
+                for y in ROW_EMPTY[(board >> (16 * x)) & ROW_MASK]]
+
+    def getMaxTile(self) -> int:
+        """ Returns the tile with maximum value """
+        exponent = maxExponent(self.board)
+        return 1 << exponent if exponent else 0
+
+    def move(self, direction: int):
+        """ Moves the grid in a specified direction """
+        if not 0 <= direction < 4:
+            return None
+
+        board = MOVES[direction](self.board)
+        moved = board != self.board
+        self.board = board
+
+        return moved
+
+    def moveUD(self, down: bool=False) -> bool:
+        """ Move up or down """
+        return self.move(DOWN if down else UP)
+
+    def moveLR(self, right: bool=False) -> bool:
+        """ Move left or right """
+        return self.move(RIGHT if right else LEFT)
+
+    merge = Grid.merge
+
+    def canMove(self, dirs=vecIndex):
+        board = self.board
+
+        # Like Grid.canMove, any empty cell counts as a possible move
+        if countEmpty(board):
+            return True
+
+        for direction in dirs:
+            if MOVES[direction](board) != board:
+                return True
+
+        return False
+
+    def getAvailableMoves(self, dirs=vecIndex): # -> List[(int, BitGrid)]
+        """ Returns a list of available moves, along with moved grids """
+        availableMoves = []
+        board = self.board
+
+        for x in dirs:
+            moved = MOVES[x](board)
+
+            if moved != board:
+                gridCopy = BitGrid.__new__(BitGrid)
+                gridCopy.size  = 4
+                gridCopy.board = moved
+                availableMoves.append((x, gridCopy))
+
+        return availableMoves
+
+
+def randomGrids(gridClass, count: int, seed: int=0) -> list:
+    """ Returns count grids reached by random play, for checks and benchmarks """
+    rng = random.Random(seed)
+    grids = []
+    grid = gridClass()
+
+    while len(grids) < count:
+        cells = grid.getAvailableCells()
+        if not cells or not grid.canMove():
+            grid = gridClass()
+            continue
+        grid.setCellValue(rng.choice(cells), 2 if rng.random() < 0.9 else 4)
+        grids.append(grid.clone())
+        grid.move(rng.randrange(4))
+
+    return grids
+
+
+def benchmark(count: int=20000) -> None:
+    """ Checks BitGrid against Grid and compares moves per second """
+    slowGrids = randomGrids(Grid, count)
+    fastGrids = [BitGrid() for _ in slowGrids]
+    for slow, fast in zip(slowGrids, fastGrids):
+        fast.map = slow.map
+
+    for slow, fast in zip(slowGrids, fastGrids):
+        for direction in vecIndex:
+            a, b = slow.clone(), fast.clone()
+            if a.move(direction) != b.move(direction) or a.map != b.map:
+                raise AssertionError("BitGrid disagrees with Grid on %s" % slow.map)
+        if (any(slow.canMove([d]) != fast.canMove([d]) for d in vecIndex)
+                or slow.canMove() != fast.canMove() or slow.getMaxTile() != fast.getMaxTile()
+                or slow.getAvailableCells() != fast.getAvailableCells()):
+            raise AssertionError("BitGrid disagrees with Grid on %s" % slow.map)
+
+    rates = []
+    for grids in (slowGrids, fastGrids):
+        start = time.perf_counter()
+        for grid in grids:
+            for direction in vecIndex:
+                grid.clone().move(direction)
+        rates.append(4 * len(grids) / (time.perf_counter() - start))
+
+    print("Grid:    %10.0f moves/s" % rates[0])
+    print("BitGrid: %10.0f moves/s" % rates[1])
+    print("Speedup: %10.1fx" % (rates[1] / rates[0]))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,396 @@
+import gc
+import time
+import tracemalloc
+
+from BitGrid import MOVES, ROW_MASK, ROW_EMPTY
+from MoveOrdering import NEIGHBOURS
+from Symmetry import canonical, canonicalKey, FORWARD, BACKWARD
+from TranspositionTable import EXACT, LOWER, UPPER
+
+# Make/unmake search for IntelligentAgent. The search works on one packed
+# board held in self.board: moves and tile spawns are applied to it in place
+# and undone from a preallocated per-ply undo stack, and player moves and
+# spawn cells are generated and ordered in preallocated per-ply buffers.
+# Nodes create no lists, tuples or Grid objects. What the search keeps is
+# the agent's transposition table, whose entries are tuples, and the
+# expectimax afterstate cache, which is three dicts of ints and floats that
+# the garbage collector does not track.
+#
+# It computes the same values and moves as the agent's regular search on a
+# BitGrid, with the same transposition table, move ordering and caches.
+
+ROW_SHIFTS = (0, 16, 32, 48)
+# EMPTY_SHIFTS[row] are the nibble shifts of the empty cells of a packed row
+EMPTY_SHIFTS = tuple(tuple(4 * y for y in cells) for cells in ROW_EMPTY)
+MOVE_ORDER = (1, 3, 2, 0)
+
+
+class BoardSearch:
+    """
+        Minimax and expectimax over a single mutable packed board.
+        Reads depth limit, deadline, evaluator, transposition table and move
+        orderer from the owning agent.
+    """
+    def __init__(self, agent, max_plies):
+        self.agent = agent
+        self.board = 0
+        self.root = None
+        self.best_move = None
+        self.undo = [0] * (max_plies + 2)
+        self.move_buffers = [[0] * 4 for _ in range(max_plies + 2)]
+        self.board_buffers = [[0] * 4 for _ in range(max_plies + 2)]
+        self.cell_buffers = [[0] * 16 for _ in range(max_plies + 2)]
+        self.damage_buffers = [[0] * 16 for _ in range(max_plies + 2)]
+        # Expectimax afterstate cache: remaining depth, probability and value by board
+        self.afterstate_depths = {}
+        self.afterstate_probs = {}
+        self.afterstate_values = {}
+
+    def search(self, board):
+        """ Searches board to the agent's max_depth and returns (best move, value) """
+        # iterations of one move share the afterstates, a new root clears them
+        if board != self.root:
+            self.root = board
+            self.afterstate_depths.clear()
+            self.afterstate_probs.clear()
+            self.afterstate_values.clear()
+        self.board = board
+        self.best_move = None
+        if self.agent.search_mode == "expectimax":
+            value = self.expectimax(0, 1.0)
+        else:
+            value = self.maximize(-10000, 10000, 0)
+        return self.best_move, value
+
+    def generate_moves(self, depth):
+        """ Fills the ply's buffers with the legal moves and their boards, returns how many """
+        board = self.board
+        moves = self.move_buffers[depth]
+        boards = self.board_buffers[depth]
+        count = 0
+        for move in MOVE_ORDER:
+            moved = MOVES[move](board)
+            if moved != board:
+                moves[count] = move
+                boards[count] = moved
+                count += 1
+        return count
+
+    def order_moves(self, depth, count):
+        """ Stable insertion sort of the ply's moves, killers first, then by history score """
+        orderer = self.agent.orderer
+        killers = orderer.killers[depth]
+        history = orderer.history
+        moves = self.move_buffers[depth]
+        boards = self.board_buffers[depth]
+        for i in range(1, count):
+            move, board = moves[i], boards[i]
+            not_killer, score = move not in killers, history[move]
+            j = i - 1
+            while j >= 0 and ((moves[j] not in killers) > not_killer
+                              or ((moves[j] not in killers) == not_killer and history[moves[j]] < score)):
+                moves[j + 1], boards[j + 1] = moves[j], boards[j]
+                j -= 1
+            moves[j + 1], boards[j + 1] = move, board
+
+    def move_to_front(self, depth, count, move):
+        """ Moves one move of the ply to the front, keeping the order of the others """
+        moves = self.move_buffers[depth]
+        boards = self.board_buffers[depth]
+        for i in range(count):
+            if moves[i] == move:
+                board = boards[i]
+                for j in range(i, 0, -1):
+                    moves[j], boards[j] = moves[j - 1], boards[j - 1]
+                moves[0], boards[0] = move, board
+                return
+
+    def generate_cells(self, depth, exponent):
+        """
+        Fills the ply's buffer with the shifts of the empty cells, most damaging
+        spawn first if the agent orders moves, and returns how many
+        """
+        board = self.board
+        cells = self.cell_buffers[depth]
+        count = 0
+        for row_shift in ROW_SHIFTS:
+            for col_shift in EMPTY_SHIFTS[(board >> row_shift) & ROW_MASK]:
+                cells[count] = row_shift + col_shift
+                count += 1
+
+        if self.agent.orderer is not None:
+            # same estimate and stable order as MoveOrderer.order_cells
+            damages = self.damage_buffers[depth]
+            for i in range(count):
+                cell, damage = cells[i], 0
+                for shift in NEIGHBOURS[cells[i] >> 2]:
+                    neighbour = (board >> shift) & 0xF
+                    if neighbour == exponent:
+                        damage -= 2 * exponent
+                    else:
+                        damage += neighbour
+                j = i - 1
+                while j >= 0 and damages[j] < damage:
+                    cells[j + 1], damages[j + 1] = cells[j], damages[j]
+                    j -= 1
+                cells[j + 1], damages[j + 1] = cell, damage
+        return count
+
+    def maximize(self, alpha, beta, depth):
+        agent = self.agent
+        depth += 1
+        agent.check_deadline()
+        if depth > agent.max_depth:
+            return agent.evaluator.evaluate(self.board)
+        count = self.generate_moves(depth)
+        if count == 0:
+            return agent.evaluator.evaluate(self.board)
+
+        orderer = agent.orderer
+        if orderer is not None:
+            self.order_moves(depth, count)
+        if depth == 1 and agent.pv_move is not None:
+            self.move_to_front(depth, count, agent.pv_move)
+
+        remaining = agent.max_depth + 1 - depth
+        table = agent.table
+        key, transform = None, 0
+        if table is not None:
+            if agent.symmetry:
+                key, transform = canonical(self.board)
+            else:
+                key = self.board
+            entry = table.lookup(key)
+            # same use of the entry as IntelligentAgent.maximize
+            if entry is not None and depth > 1:
+                self.move_to_front(depth, count, BACKWARD[transform][entry[3]])
+                if entry[0] >= remaining:
+                    if entry[2] == EXACT:
+                        return entry[1]
+                    if entry[2] == LOWER:
+                        alpha = max(alpha, entry[1])
+                    else:
+                        beta = min(beta, entry[1])
+                    if alpha >= beta:
+                        return entry[1]
+
+        moves = self.move_buffers[depth]
+        boards = self.board_buffers[depth]
+        undo = self.undo
+        alpha_orig = alpha
+        max_move, max_util = None, -100000
+        for i in range(count):
+            undo[depth] = self.board
+            self.board = boards[i]
+            min_util = self.spawn_value(alpha, beta, depth)
+            self.board = undo[depth]
+
+            if min_util > max_util:
+                max_move, max_util = moves[i], min_util
+
+            if max_util >= beta:
+                if orderer is not None:
+                    orderer.record_cutoff(moves[i], depth, remaining)
+                break
+
+            alpha = max(alpha, max_util)
+
+        if depth == 1:
+            self.best_move = max_move
+        if key is not None:
+            if max_util <= alpha_orig:
+                bound = UPPER
+            elif max_util >= beta:
+                bound = LOWER
+            else:
+                bound = EXACT
+            table.store(key, remaining, max_util, bound, FORWARD[transform][max_move])
+
+        return max_util
+
+    def spawn_value(self, alpha, beta, depth):
+        """ Minimax value of the moved board, searched like IntelligentAgent.spawn_value """
+        min_util_2 = self.minimize(alpha, beta, depth, 1)
+        alpha_4, beta_4 = (alpha - .9*min_util_2) / .1, (beta - .9*min_util_2) / .1
+        min_util_4 = self.minimize(alpha_4, beta_4, depth, 2)
+        util = (.9*min_util_2) + (.1*min_util_4)
+        if alpha < min_util_2 < beta or (min_util_2 <= alpha and util <= alpha) or (min_util_2 >= beta and util >= beta):
+            return util
+
+        if not alpha_4 < min_util_4 < beta_4:
+            min_util_4 = self.minimize(-10000, 10000, depth, 2)
+        min_util_2 = self.minimize((alpha - .1*min_util_4) / .9, (beta - .1*min_util_4) / .9, depth, 1)
+        return (.9*min_util_2) + (.1*min_util_4)
+
+    def minimize(self, alpha, beta, depth, exponent):
+        agent = self.agent
+        depth += 1
+        agent.check_deadline()
+        board = self.board
+        if depth > agent.max_depth:
+            return agent.evaluator.evaluate(board)
+        count = self.generate_cells(depth, exponent)
+        if count == 0:
+            return agent.evaluator.evaluate(board)
+
+        cells = self.cell_buffers[depth]
+        undo = self.undo
+        min_util = 100000
+        for i in range(count):
+            undo[depth] = self.board
+            self.board = board | (exponent << cells[i])
+            max_util = self.maximize(alpha, beta, depth)
+            self.board = undo[depth]
+
+            if max_util < min_util:
+                min_util = max_util
+
+            if min_util <= alpha:
+                return min_util
+
+            beta = min(beta, min_util)
+
+        return min_util
+
+    def expectimax(self, depth, prob):
+        agent = self.agent
+        depth += 1
+        agent.check_deadline()
+        if depth > agent.max_depth or prob < agent.prob_threshold:
+            return agent.evaluator.evaluate(self.board)
+        count = self.generate_moves(depth)
+        if count == 0:
+            return agent.evaluator.evaluate(self.board)
+        if depth == 1 and agent.pv_move is not None:
+            self.move_to_front(depth, count, agent.pv_move)
+
+        moves = self.move_buffers[depth]
+        boards = self.board_buffers[depth]
+        undo = self.undo
+        max_util = -100000
+        for i in range(count):
+            undo[depth] = self.board
+            self.board = boards[i]
+            util = self.chance(depth, prob)
+            self.board = undo[depth]
+
+            if util > max_util:
+                max_util = util
+                if depth == 1:
+                    self.best_move = moves[i]
+
+        return max_util
+
+    def chance(self, depth, prob):
+        agent = self.agent
+        depth += 1
+        agent.check_deadline()
+        board = self.board
+        if depth > agent.max_depth:
+            return agent.evaluator.evaluate(board)
+
+        empty = (len(EMPTY_SHIFTS[board & ROW_MASK]) + len(EMPTY_SHIFTS[(board >> 16) & ROW_MASK])
+                 + len(EMPTY_SHIFTS[(board >> 32) & ROW_MASK]) + len(EMPTY_SHIFTS[(board >> 48) & ROW_MASK]))
+        if empty == 0:
+            return agent.evaluator.evaluate(board)
+
+        # same reuse rule as IntelligentAgent.chance
+        remaining = agent.max_depth + 1 - depth
+        key = canonicalKey(board) if agent.symmetry else board
+        if self.afterstate_depths.get(key, -1) >= remaining and self.afterstate_probs[key] >= prob:
+            agent.afterstate_hits += 1
+            return self.afterstate_values[key]
+
+        two_prob = agent.probability
+        cell_prob = prob / empty
+        undo = self.undo
+        total = 0
+        for row_shift in ROW_SHIFTS:
+            for col_shift in EMPTY_SHIFTS[(board >> row_shift) & ROW_MASK]:
+                shift = row_shift + col_shift
+                undo[depth] = self.board
+                self.board = board | (1 << shift)
+                total += two_prob * self.expectimax(depth, cell_prob * two_prob)
+                self.board = board | (2 << shift)
+                total += (1 - two_prob) * self.expectimax(depth, cell_prob * (1 - two_prob))
+                self.board = undo[depth]
+
+        util = total / empty
+        self.afterstate_depths[key] = remaining
+        self.afterstate_probs[key] = prob
+        self.afterstate_values[key] = util
+        return util
+
+
+def _deepen(agent, grids, depth):
+    """ Searches every grid by iterative deepening to depth, like getMove without a deadline """
+    results = []
+    for grid in grids:
+        agent.pv_move = None
+        agent.afterstates.clear()
+        if agent.orderer:
+            agent.orderer.new_search()
+        for agent.max_depth in range(1, depth + 1, 2):
+            agent.pv_move, value = agent.search_once(grid)
+        results.append((agent.pv_move, value))
+    return results
+
+
+def benchmark(count=10, depth=7):
+    """
+    Compares the regular and the make/unmake search by iterative deepening to a
+    fixed depth, with the agent's default transposition table and ordering.
+    Reports garbage collections per generation and the time spent in them,
+    from gc.get_stats() and gc callbacks, and the peak traced memory of a
+    second run under tracemalloc.
+    """
+    from BitGrid import BitGrid, randomGrids
+    from IntelligentAgent import IntelligentAgent
+
+    grids = [grid for grid in randomGrids(BitGrid, 40 * count, seed=5)[::40] if grid.canMove()]
+    pause = [0.0, 0.0]
+
+    def time_collections(phase, info):
+        if phase == "start":
+            pause[1] = time.perf_counter()
+        else:
+            pause[0] += time.perf_counter() - pause[1]
+
+    gc.collect()
+    gc.callbacks.append(time_collections)
+    try:
+        for mode in ("minimax", "expectimax"):
+            reference = None
+            for inplace in (False, True):
+                agent = IntelligentAgent(search_mode=mode, inplace=inplace)
+                agent.clock = time.perf_counter
+                agent.deadline = float("inf")
+                agent.nodes = 0
+                pause[0] = 0.0
+                before = [stats["collections"] for stats in gc.get_stats()]
+
+                start = time.perf_counter()
+                results = _deepen(agent, grids, depth)
+                elapsed = time.perf_counter() - start
+                nodes = agent.nodes
+
+                collections = [stats["collections"] - runs for stats, runs in zip(gc.get_stats(), before)]
+                agent = IntelligentAgent(search_mode=mode, inplace=inplace)
+                agent.clock = time.perf_counter
+                agent.deadline = float("inf")
+                tracemalloc.start()
+                _deepen(agent, grids, depth)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+                if reference is None:
+                    reference = results
+                print("%-10s %-12s %8d nodes %9.0f nodes/s  gc runs %s in %6.1f ms  peak %7.0f KiB  same result %s"
+                      % (mode, "make/unmake" if inplace else "regular", nodes, nodes / elapsed,
+                         "/".join(map(str, collections)), 1000 * pause[0], peak / 1024, results == reference))
+    finally:
+        gc.callbacks.remove(time_collections)
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -2,7 +2,11 @@ import random
 from BaseAI import BaseAI
 
 class ComputerAI(BaseAI):
+    def __init__(self, seed=None):
+        # Without a seed the module level generator is used, so random.seed still applies
+        self.random = random.Random(seed) if seed is not None else random
+
     def getMove(self, grid):
         """ Returns a randomly selected cell if possible """
         cells = grid.getAvailableCells()
-        return random.choice(cells) if cells else None
\ No newline at end of file
+        return self.random.choice(cells) if cells else None
\ No newline at end of file
@@ -0,0 +1,202 @@
+import random
+import time
+
+from BitGrid import SPREAD, ROW_EMPTY, ROW_MASK, maxExponent, toBoard
+from Symmetry import canonicalKey
+
+# Table driven version of the heuristics in IntelligentAgent. Every term of
+# evaluate_state except the max tile checks is a sum over rows and columns,
+# so the per-line parts are precomputed for all 65536 packed lines and a board
+# is scored with 4 row and 4 column lookups.
+#
+# A table entry packs three small non-negative counters into one int so the
+# four lookups can simply be added:
+#   bits 0-7   : minus the increasing monotonicity penalty of the line
+#   bits 8-15  : minus the decreasing monotonicity penalty of the line
+#   bits 16-23 : number of empty cells (row table only)
+
+
+def line_monotonicity(line):
+    """
+    Monotonicity penalties of one line of exponents, following h_monotonicity:
+    each tile is compared with the next non-empty tile at most two cells further.
+    :return (increasing, decreasing) penalties, both <= 0
+    """
+    increasing, decreasing = 0, 0
+    for current in range(3):
+        cur_val = line[current]
+        if cur_val != 0:
+            next_tile = 0
+            for i in range(1, 3):
+                if current + i < 4 and line[current + i] != 0:
+                    next_tile = line[current + i]
+                    break
+            if next_tile > cur_val:
+                increasing += cur_val - next_tile
+            elif next_tile < cur_val:
+                decreasing += next_tile - cur_val
+    return increasing, decreasing
+
+
+def _build_tables():
+    row_table, col_table = [], []
+    for row in range(1 << 16):
+        line = [(row >> (4 * i)) & 0xF for i in range(4)]
+        increasing, decreasing = line_monotonicity(line)
+        mono = -increasing | (-decreasing << 8)
+        col_table.append(mono)
+        row_table.append(mono | (len(ROW_EMPTY[row]) << 16))
+    return row_table, col_table
+
+
+ROW_TABLE, COL_TABLE = _build_tables()
+
+# Raised when symmetric caching is asked of an evaluator that cannot support it
+SYMMETRY_ERROR = ("Symmetric caching is opt-in and needs an evaluator that scores all 8 orientations of a "
+                  "board the same. The default weights score monotonicity and the corner tile by "
+                  "orientation; use an NTupleNetwork (ntuple_weights=...) or TableEvaluator(0, 0, w3, w4)")
+
+# Exponent of the tile that earns the h_weight_higher_values bonus
+BONUS_EXPONENT = 11
+# Cell (0, 3) holds the corner tile checked by h_max_tile_on_edge
+CORNER_SHIFT = 12
+
+
+class TableEvaluator:
+    """
+        Scores packed boards with precomputed line tables.
+        With the default weights the score equals IntelligentAgent's original
+        evaluate_state: .5 * monotonicity + max tile on edge + free cells + 2048 bonus.
+    """
+    def __init__(self, monotonicity=.5, edge=1, free_cells=1, bonus=1):
+        self.monotonicity = monotonicity
+        self.edge = edge
+        self.free_cells = free_cells
+        self.bonus = bonus
+
+    def weights(self):
+        return (self.monotonicity, self.edge, self.free_cells, self.bonus)
+
+    def is_symmetric(self):
+        """
+        True if rotated and mirrored boards score the same. The corner check and
+        the two cell look-ahead of the monotonicity penalty are orientation
+        dependent, so only free cells and the 2048 bonus are symmetric.
+        """
+        return self.monotonicity == 0 and self.edge == 0
+
+    def fingerprint(self):
+        """ Identifies the evaluation, two evaluators with equal fingerprints score alike """
+        return ("table",) + self.weights()
+
+    def evaluate(self, board):
+        """ Returns the heuristic score of a packed board """
+        rows = (ROW_TABLE[board & ROW_MASK] + ROW_TABLE[(board >> 16) & ROW_MASK]
+                + ROW_TABLE[(board >> 32) & ROW_MASK] + ROW_TABLE[(board >> 48) & ROW_MASK])
+        t = (SPREAD[board & ROW_MASK] | (SPREAD[(board >> 16) & ROW_MASK] << 4)
+             | (SPREAD[(board >> 32) & ROW_MASK] << 8) | (SPREAD[(board >> 48) & ROW_MASK] << 12))
+        cols = (COL_TABLE[t & ROW_MASK] + COL_TABLE[(t >> 16) & ROW_MASK]
+                + COL_TABLE[(t >> 32) & ROW_MASK] + COL_TABLE[(t >> 48) & ROW_MASK])
+
+        mono = -min(rows & 0xFF, (rows >> 8) & 0xFF) - min(cols & 0xFF, (cols >> 8) & 0xFF)
+        top = maxExponent(board)
+        on_edge = 1 if (board >> CORNER_SHIFT) & 0xF == top else 0
+        bonus = 100 if top == BONUS_EXPONENT else 0
+
+        return self.monotonicity*mono + self.edge*on_edge + self.free_cells*(rows >> 16) + self.bonus*bonus
+
+    def evaluate_grid(self, grid):
+        """ Returns the heuristic score of a Grid or BitGrid """
+        return self.evaluate(toBoard(grid))
+
+
+class CachedEvaluator:
+    """
+        Memoizes the scores of another evaluator. With symmetry the cache is
+        keyed by the canonical form of the board, so all 8 orientations of a
+        position share one entry; that requires a symmetric evaluator.
+    """
+    def __init__(self, evaluator, max_entries=1 << 20, symmetry=False):
+        if symmetry and not evaluator.is_symmetric():
+            raise ValueError(SYMMETRY_ERROR)
+        self.evaluator = evaluator
+        self.max_entries = max_entries
+        self.symmetry = symmetry
+        self.scores = {}
+        self.probes = 0
+        self.hits = 0
+
+    def is_symmetric(self):
+        return self.evaluator.is_symmetric()
+
+    def fingerprint(self):
+        return self.evaluator.fingerprint()
+
+    def evaluate(self, board):
+        self.probes += 1
+        key = canonicalKey(board) if self.symmetry else board
+        score = self.scores.get(key)
+        if score is not None:
+            self.hits += 1
+            return score
+
+        if len(self.scores) >= self.max_entries:
+            self.scores.clear()
+        score = self.scores[key] = self.evaluator.evaluate(board)
+        return score
+
+    def evaluate_grid(self, grid):
+        return self.evaluate(toBoard(grid))
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+
+def reference_score(grid, weights=(.5, 1, 1, 1)):
+    """ Scores a grid with the original Python heuristics """
+    from IntelligentAgent import h_monotonicity, h_max_tile_on_edge, h_free_cells, h_weight_higher_values
+
+    w_mono, w_edge, w_free, w_bonus = weights
+    return (w_mono*h_monotonicity(grid.map) + w_edge*h_max_tile_on_edge(grid)
+            + w_free*h_free_cells(grid) + w_bonus*h_weight_higher_values(grid))
+
+
+def verify(count=20000, seed=0):
+    """ Checks the table scores against the Python heuristics and compares their cost """
+    from Grid import Grid
+    from BitGrid import unpackMap, randomGrids
+
+    rng = random.Random(seed)
+    grids = randomGrids(Grid, count // 2, seed)
+    for _ in range(count - len(grids)):
+        grid = Grid()
+        grid.map = unpackMap(sum(rng.randrange(12) << (4 * i) for i in range(16)))
+        grids.append(grid)
+
+    weight_sets = [(.5, 1, 1, 1), (2, 4.7, 1.2, 1.1), (0, 0, 1, 0), (1.3, 0, 0, .5)]
+    for weights in weight_sets:
+        evaluator = TableEvaluator(*weights)
+        for grid in grids:
+            expected = reference_score(grid, weights)
+            actual = evaluator.evaluate_grid(grid)
+            if expected != actual:
+                raise AssertionError("%s != %s for %s with weights %s" % (actual, expected, grid.map, weights))
+
+    evaluator = TableEvaluator()
+    boards = [toBoard(grid) for grid in grids]
+    start = time.perf_counter()
+    for grid in grids:
+        reference_score(grid)
+    slow = time.perf_counter() - start
+    start = time.perf_counter()
+    for board in boards:
+        evaluator.evaluate(board)
+    fast = time.perf_counter() - start
+
+    print("Verified %d boards with %d weight sets" % (len(grids), len(weight_sets)))
+    print("Python heuristics: %8.2f us/board" % (1e6 * slow / len(grids)))
+    print("Table evaluation:  %8.2f us/board" % (1e6 * fast / len(grids)))
+
+
+if __name__ == '__main__':
+    verify()
@@ -1,7 +1,10 @@
 from Grid       import Grid
+from BitGrid    import BitGrid
 from ComputerAI import ComputerAI
 from IntelligentAgent  import IntelligentAgent
-from Displayer  import Displayer
+from Displayer  import Displayer, LiveDisplayer
+from SearchTrace import SearchTrace
+from GameRecord import END_NO_MOVES, END_TIMEOUT, END_INVALID_MOVE
 
 import time
 import random
@@ -23,14 +26,30 @@ actionDic = {
 timeLimit = 0.2
 allowance = 0.05
 maxTime   = timeLimit + allowance
+# Turns longer than this fraction of maxTime count as near alarms
+nearAlarmFraction = 0.8
 
 class GameManager:
-    def __init__(self, size=4, intelligentAgent=None, computerAI=None, displayer=None):
-        self.grid = Grid(size)
+    def __init__(self, size=4, intelligentAgent=None, computerAI=None, displayer=None, gridClass=Grid, verbose=True,
+                 trace=None, recorder=None, seed=None):
+        self.grid = gridClass(size)
         self.possibleNewTiles = [2, 4]
         self.probability = defaultProbability
         self.initTiles   = defaultInitialTiles
         self.over        = False
+        self.verbose     = verbose
+        self.trace       = trace  # Path of a JSON-lines search trace, None to disable
+        self.recorder    = recorder  # GameRecorder that stores the game, None to disable
+        # Tile spawns come from their own generator when seeded, the module's otherwise
+        self.random      = random.Random(seed) if seed is not None else random
+
+        # Game statistics
+        self.moves        = 0
+        self.moveTimes    = []    # Wall time of every player move in seconds
+        self.spawnedFours = 0
+        self.timedOut     = False
+        self.nearAlarms   = 0     # Turns that came within nearAlarmFraction of maxTime
+        self.maxTurnTime  = 0.0
 
         # Initialize the AI players
         self.computerAI = computerAI or ComputerAI()
@@ -39,21 +58,36 @@ class GameManager:
 
     def updateAlarm(self) -> None:
         """ Checks if move exceeded the time limit and updates the alarm """
-        if time.process_time() - self.prevTime > maxTime:
+        turnTime = time.process_time() - self.prevTime
+        if turnTime > maxTime:
             self.over = True
+            self.timedOut = True
+        elif turnTime > nearAlarmFraction * maxTime:
+            self.nearAlarms += 1
+        self.maxTurnTime = max(self.maxTurnTime, turnTime)
         
         self.prevTime = time.process_time()
 
     def getNewTileValue(self) -> int:
         """ Returns 2 with probability 0.95 and 4 with 0.05 """
-        return self.possibleNewTiles[random.random() > self.probability]
+        value = self.possibleNewTiles[self.random.random() > self.probability]
+        if value == 4:
+            self.spawnedFours += 1
+        return value
+
+    def getScore(self) -> int:
+        """ Returns the usual 2048 score, the sum of all tiles created by merges """
+        # A tile 2^k built from 2s scored (k - 1) * 2^k, spawned 4s scored nothing
+        score = sum(value * (value.bit_length() - 2)
+                    for row in self.grid.map for value in row if value)
+        return score - 4 * self.spawnedFours
 
     def insertRandomTiles(self, numTiles:int):
         """ Insert numTiles number of random tiles. For initialization """
         for i in range(numTiles):
             tileValue = self.getNewTileValue()
             cells     = self.grid.getAvailableCells()
-            cell      = random.choice(cells) if cells else None
+            cell      = self.random.choice(cells) if cells else None
             self.grid.setCellValue(cell, tileValue)
 
     def start(self) -> int:
@@ -96,6 +130,19 @@ class GameManager:
         # self.grid.map[3][3] = 16
         self.displayer.display(self.grid)
         turn          = PLAYER_TURN # Player AI Goes First
+
+        if self.recorder:
+            self.recorder.start_game(self.grid)
+
+        # Only a traced agent pays for instrumentation
+        searchTrace = SearchTrace(self.trace) if self.trace else None
+        if searchTrace:
+            try:
+                searchTrace.attach(self.intelligentAgent)
+            except ValueError:
+                searchTrace.close()
+                raise
+
         self.prevTime = time.process_time()
 
         while self.grid.canMove() and not self.over:
@@ -105,34 +152,50 @@ class GameManager:
             move = None
 
             if turn == PLAYER_TURN:
-                print("Player's Turn: ", end="")
+                if self.verbose:
+                    print("Player's Turn: ", end="")
+                moveStart = time.perf_counter()
                 move = self.intelligentAgent.getMove(gridCopy)
-                
-                print(actionDic[move])
+                self.moveTimes.append(time.perf_counter() - moveStart)
+                self.moves += 1
+
+                if self.verbose:
+                    print(actionDic[move])
 
                 # If move is valid, attempt to move the grid
                 if move != None and 0 <= move < 4:
                     if self.grid.canMove([move]):
                         self.grid.move(move)
+                        if self.recorder:
+                            self.recorder.record_move(move, self.moveTimes[-1],
+                                                      getattr(self.intelligentAgent, "completed_depth", 0),
+                                                      getattr(self.intelligentAgent, "nodes", 0))
 
                     else:
-                        print("Invalid intelligentAgent Move - Cannot move")
+                        if self.verbose:
+                            print("Invalid intelligentAgent Move - Cannot move")
                         self.over = True
                 else:
-                    print("Invalid intelligentAgent Move - Invalid input")
+                    if self.verbose:
+                        print("Invalid intelligentAgent Move - Invalid input")
                     self.over = True
             else:
-                print("Computer's turn: ")
+                if self.verbose:
+                    print("Computer's turn: ")
                 move = self.computerAI.getMove(gridCopy)
 
                 # Validate Move
                 if move and self.grid.canInsert(move):
-                    self.grid.setCellValue(move, self.getNewTileValue())
+                    tileValue = self.getNewTileValue()
+                    self.grid.setCellValue(move, tileValue)
+                    if self.recorder:
+                        self.recorder.record_spawn(move, tileValue)
                 else:
-                    print("Invalid Computer AI Move")
+                    if self.verbose:
+                        print("Invalid Computer AI Move")
                     self.over = True
 
-            # Comment out during heuristing optimizations to increase runtimes.
+            # Headless runs pass a BaseDisplayer, which draws nothing.
             # Printing slows down computation time.
             self.displayer.display(self.grid)
 
@@ -140,46 +203,32 @@ class GameManager:
             self.updateAlarm()
             turn = 1 - turn
 
+        if searchTrace:
+            SearchTrace.detach(self.intelligentAgent)
+            searchTrace.close()
+
+        self.displayer.close()
+        # Agents with worker pools shut them down here
+        self.intelligentAgent.close()
+
+        if self.recorder:
+            if self.timedOut:
+                self.recorder.end_game(END_TIMEOUT)
+            else:
+                self.recorder.end_game(END_INVALID_MOVE if self.over else END_NO_MOVES)
+
         return self.grid.getMaxTile()
 
 def main():
-    w1_final = 1
-    w2_final = 1
-    w3_final = 1
-    w4_final = 1
-    # max_avg_score = 0
-    # for j in range(47, 56):
-    #     for k in range(10, 20):
-    #         for n in range(10, 20):
-    #             w2 = j * .1
-    #             w3 = k * .1
-    #             w4 = n * .1
-    #             avg_score = 0
-    #             for m in range(5):
-    #                 intelligentAgent = IntelligentAgent(0, w2, w3, w4)
-    #                 computerAI = ComputerAI()
-    #                 displayer = Displayer()
-    #                 gameManager = GameManager(4, intelligentAgent, computerAI, displayer)
-    #                 max = gameManager.start()
-    #                 avg_score += max
-    #                 if max > 1024:
-    #                     print("HOLY SHIT WE MADE IT!")
-    #                     print("Final weights: " + "," + str(w2) + "," + str(w3) + "," + str(w4))
-    #                 print("Finished game")
-    #             avg_score = avg_score/5
-    #             if avg_score > max_avg_score:
-    #                 max_avg_score = avg_score
-    #                 w2_final = w2
-    #                 w3_final = w3
-    #                 w4_final = w4
-    #                 print("Updated weights: " + "," + str(w2_final) + "," + str(w3_final) + "," + str(w4_final))
+    # Weights are tuned with Tuner.py, which runs the games in parallel
     scores = []
     time_total = time.process_time()
     for i in range(10):
         intelligentAgent = IntelligentAgent()
         computerAI  = ComputerAI()
-        displayer   = Displayer()
-        gameManager = GameManager(4, intelligentAgent, computerAI, displayer)
+        displayer   = LiveDisplayer()
+        # Turn by turn prints would scroll through the live board
+        gameManager = GameManager(4, intelligentAgent, computerAI, displayer, BitGrid, verbose=False)
 
         maxTile     = gameManager.start()
         scores.append(maxTile)
@@ -190,7 +239,6 @@ def main():
         print(str(score) + ",")
     time_total = time.process_time() - time_total
     print("Total time: " + str(time_total))
-    #print("Final weights: " + str(w1_final) + "," + str(w2_final) + "," + str(w3_final) + "," + str(w4_final))
 
 if __name__ == '__main__':
     main()
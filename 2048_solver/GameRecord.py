@@ -0,0 +1,242 @@
+import argparse
+import random
+import struct
+import time
+
+from BitGrid import BitGrid, toBoard, unpackMap
+
+# Compact binary records of 2048 games. A record file starts with a short
+# header and holds any number of games one after another, so games can be
+# appended while they are played and read back one at a time:
+#
+#   file header : "G48R", format version                    ("<4sB")
+#   game header : flags, initial packed board               ("<BQ")
+#   turns       : one byte per player move and tile spawn
+#                   bits 0-1 move, bits 2-5 spawn cell 4 * x + y, bit 6 set for a 4
+#                 0x80 | move for a last move without a spawn, 0xFF ends the turns
+#   stats       : with FLAG_STATS, after every turn byte but the end marker:
+#                 search time, completed depth and nodes     ("<fHI")
+#   game footer : how the game ended, one of the END_ values ("<B")
+
+MAGIC = b"G48R"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sB")
+GAME_HEADER = struct.Struct("<BQ")
+STATS = struct.Struct("<fHI")
+FLAG_STATS = 1
+NO_SPAWN = 0x80
+END_OF_TURNS = 0xFF
+(END_NO_MOVES, END_TIMEOUT, END_INVALID_MOVE) = (0, 1, 2)
+
+
+class GameRecorder:
+    """
+        Streaming writer. Turns are packed into a buffer in memory and only
+        written out when a game ends, so recording costs the game loop a few
+        appends per move.
+        :param output : Path of the record file, or a binary file opened for writing
+        :param stats->bool : Store search time, depth and nodes of every move
+    """
+    def __init__(self, output, stats=True):
+        self.own_file = isinstance(output, str)
+        self.file = open(output, "wb") if self.own_file else output
+        self.file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self.stats = stats
+        self.buffer = bytearray()
+        self.move = None
+        self.move_stats = None
+        self.games = 0
+
+    def start_game(self, grid):
+        self.buffer = bytearray(GAME_HEADER.pack(FLAG_STATS if self.stats else 0, toBoard(grid)))
+        self.move = None
+
+    def record_move(self, move, elapsed=0.0, depth=0, nodes=0):
+        self.move = move
+        if self.stats:
+            self.move_stats = STATS.pack(elapsed, min(depth, 0xFFFF), min(nodes, 0xFFFFFFFF))
+
+    def record_spawn(self, cell, value):
+        self.buffer.append(self.move | ((4 * cell[0] + cell[1]) << 2) | ((value == 4) << 6))
+        if self.stats:
+            self.buffer += self.move_stats
+        self.move = None
+
+    def end_game(self, status=END_NO_MOVES):
+        if self.move is not None:
+            self.buffer.append(NO_SPAWN | self.move)
+            if self.stats:
+                self.buffer += self.move_stats
+        self.buffer.append(END_OF_TURNS)
+        self.buffer.append(status)
+        self.file.write(self.buffer)
+        self.buffer = bytearray()
+        self.move = None
+        self.games += 1
+
+    def close(self):
+        if self.own_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class GameRecord:
+    """ One recorded game: initial board, (move, cell, value) turns, per-move stats and end status """
+    def __init__(self, board, turns, stats, status):
+        self.board = board
+        self.turns = turns
+        self.stats = stats
+        self.status = status
+
+    def replay(self, gridClass=BitGrid):
+        """
+        Plays the game back.
+        :return generator of (grid before the move, move, stats of the move or None)
+        """
+        grid = gridClass()
+        grid.map = unpackMap(self.board)
+        for i, (move, cell, value) in enumerate(self.turns):
+            yield grid.clone(), move, self.stats[i] if self.stats else None
+            # GameManager accepts moves that leave the board unchanged while
+            # a cell is empty, so these are replayed as recorded
+            grid.move(move)
+            if cell is not None:
+                grid.setCellValue(cell, value)
+
+    def final_grid(self, gridClass=BitGrid):
+        grid = gridClass()
+        grid.map = unpackMap(self.board)
+        for move, cell, value in self.turns:
+            grid.move(move)
+            if cell is not None:
+                grid.setCellValue(cell, value)
+        return grid
+
+
+def read_records(source):
+    """
+    Streams the games of a record file.
+    :param source : Path of the record file, or a binary file opened for reading
+    :return generator of GameRecord
+    """
+    own_file = isinstance(source, str)
+    record_file = open(source, "rb") if own_file else source
+    try:
+        magic, version = FILE_HEADER.unpack(record_file.read(FILE_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a game record file of version %d" % VERSION)
+
+        while True:
+            header = record_file.read(GAME_HEADER.size)
+            if not header:
+                return
+            flags, board = GAME_HEADER.unpack(header)
+            has_stats = flags & FLAG_STATS
+            turns, stats = [], []
+
+            while True:
+                turn = record_file.read(1)[0]
+                if turn == END_OF_TURNS:
+                    break
+                if turn & NO_SPAWN:
+                    turns.append((turn & 3, None, None))
+                else:
+                    cell = (turn >> 2) & 0xF
+                    turns.append((turn & 3, (cell >> 2, cell & 3), 4 if turn & 0x40 else 2))
+                if has_stats:
+                    stats.append(STATS.unpack(record_file.read(STATS.size)))
+
+            status = record_file.read(1)[0]
+            yield GameRecord(board, turns, stats if has_stats else None, status)
+    finally:
+        if own_file:
+            record_file.close()
+
+
+def rescore(source, agent_kwargs=None, depth=None, limit=None):
+    """
+    Searches recorded positions again with another agent configuration.
+    :param depth->int : Search every position to this fixed depth, None uses the agent's time budget
+    :param limit->int : Positions per game, None for all
+    :return list of dicts, one per game, with how often the new agent agrees with the recorded move
+    """
+    from IntelligentAgent import IntelligentAgent
+
+    results = []
+    for record in read_records(source):
+        agent = IntelligentAgent(**(agent_kwargs or {}))
+        agree = positions = 0
+        start = time.perf_counter()
+        for grid, move, stats in record.replay():
+            if limit is not None and positions >= limit:
+                break
+            if depth is None:
+                new_move = agent.getMove(grid)
+            else:
+                agent.clock = time.perf_counter
+                agent.deadline = float("inf")
+                agent.afterstates.clear()
+                if agent.orderer:
+                    agent.orderer.new_search()
+                for agent.max_depth in range(1, depth + 1, 2):
+                    new_move, value = agent.search_once(grid)
+            agree += new_move == move
+            positions += 1
+        results.append({"positions": positions, "agreement": agree / positions if positions else 0.0,
+                        "max_tile": record.final_grid().getMaxTile(), "status": record.status,
+                        "elapsed": time.perf_counter() - start})
+    return results
+
+
+def record_games(path, games, seed=0, agent_kwargs=None):
+    """ Plays seeded headless games and records them all to path """
+    from BaseDisplayer import BaseDisplayer
+    from ComputerAI import ComputerAI
+    from GameManager import GameManager
+    from IntelligentAgent import IntelligentAgent
+
+    with GameRecorder(path) as recorder:
+        for game in range(games):
+            random.seed(seed + game)
+            manager = GameManager(4, IntelligentAgent(**(agent_kwargs or {})), ComputerAI(), BaseDisplayer(),
+                                  BitGrid, verbose=False, recorder=recorder)
+            print("game %d: max tile %d, %d moves" % (seed + game, manager.start(), manager.moves))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record, replay and re-score 2048 games")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record_parser = subparsers.add_parser("record", help="play and record seeded games")
+    record_parser.add_argument("path")
+    record_parser.add_argument("-n", "--games", type=int, default=1)
+    record_parser.add_argument("--seed", type=int, default=0)
+    replay_parser = subparsers.add_parser("replay", help="print a summary of every recorded game")
+    replay_parser.add_argument("path")
+    rescore_parser = subparsers.add_parser("rescore", help="search recorded positions with another agent")
+    rescore_parser.add_argument("path")
+    rescore_parser.add_argument("--mode", choices=["minimax", "expectimax"], default="minimax")
+    rescore_parser.add_argument("--depth", type=int, default=None)
+    rescore_parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record_games(args.path, args.games, args.seed)
+    elif args.command == "replay":
+        for i, record in enumerate(read_records(args.path)):
+            mean_time = sum(stats[0] for stats in record.stats) / len(record.stats) if record.stats else 0.0
+            print("game %d: %d moves, max tile %d, end status %d, mean search time %.3f s"
+                  % (i, len(record.turns), record.final_grid().getMaxTile(), record.status, mean_time))
+    else:
+        for i, result in enumerate(rescore(args.path, {"search_mode": args.mode}, args.depth, args.limit)):
+            print("game %d: %d positions, %.1f%% same move" % (i, result["positions"], 100 * result["agreement"]))
+
+
+if __name__ == '__main__':
+    main()
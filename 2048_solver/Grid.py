@@ -15,6 +15,10 @@ class Grid:
 
         return gridCopy
 
+    def hashKey(self):
+        """ Returns a hashable key identifying the board """
+        return tuple(map(tuple, self.map))
+
     def canInsert(self, pos: tuple) -> bool:
         return self.getCellValue(pos) == 0
 
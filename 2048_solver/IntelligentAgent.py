@@ -1,8 +1,19 @@
 import time
 import math
 import sys
+import hashlib
+from operator import methodcaller
 
 from BaseAI import BaseAI
+from TranspositionTable import TranspositionTable, EXACT, LOWER, UPPER
+from Evaluation import TableEvaluator, CachedEvaluator, SYMMETRY_ERROR
+from BitGrid import toBoard
+from Symmetry import canonical, FORWARD, BACKWARD
+from MoveOrdering import MoveOrderer
+from BoardSearch import BoardSearch
+from NTuple import NTupleNetwork
+from TimeBank import TimeBank
+from PositionCache import PositionCache
 
 sys.setrecursionlimit(10**6)
 
@@ -113,60 +124,288 @@ def h_average_tile(board):
     return 0 if nums == 0 else avg/nums
 
 MOVE_ORDER = [1, 3, 2, 0]
+# Iterative deepening adds one player move and one tile spawn per iteration
+MAX_DEPTH = 21
+TIME_LIMIT = 0.1
+# The clock is only read every CHECK_INTERVAL nodes
+CHECK_INTERVAL = 32
+SEARCH_MODES = ("minimax", "expectimax")
+# Move generators of an untraced search. SearchTrace swaps timed ones into the
+# agent, so the search calls whichever is bound without a wrapper of its own
+GENERATE_MOVES = methodcaller("getAvailableMoves")
+GENERATE_CELLS = methodcaller("getAvailableCells")
 
 
-class IntelligentAgent(BaseAI):
+class SearchTimeout(Exception):
+    """ Raised inside the search once the move deadline has passed """
+    pass
+
 
-    def __init__(self):
-        self.time = 0
-        self.w1 = 2
-        self.w2 = 4.7
-        self.w3 = 1.2
-        self.w4 = 1.1
+class IntelligentAgent(BaseAI):
 
+    def __init__(self, w1=.5, w2=1, w3=1, w4=1, table_size_mb=16, search_mode="minimax", probability=None,
+                 prob_threshold=0.0001, evaluator=None, symmetry=False, move_ordering=True,
+                 inplace=False, ntuple_weights=None, adaptive_time=False, position_cache=None,
+                 position_cache_depth=5, eval_cache_entries=0):
+        """
+        :param w1..w4->float : Weights of monotonicity, max tile in the corner,
+                               free cells and the 2048 bonus in the evaluation
+        :param table_size_mb->float : Memory for the transposition table, 0 disables it
+        :param search_mode->str : "minimax" treats the tile spawn as an adversary,
+                                  "expectimax" averages over every possible spawn
+        :param probability->float : Chance of spawning a 2, GameManager.defaultProbability if None
+        :param prob_threshold->float : Expectimax evaluates a node as a leaf once the
+                                       probability of reaching it drops below this
+        :param evaluator->TableEvaluator : Scores leaf boards, built from w1..w4 if None
+        :param symmetry->bool : Key the search caches by the canonical orientation of
+                                the board. Opt-in: the default weights are not symmetric, so
+                                it needs ntuple_weights or w1 = w2 = 0, otherwise ValueError
+        :param move_ordering->bool : Order minimax moves by killer and history tables and
+                                     spawns most damaging first, instead of a fixed order
+        :param inplace->bool : Search with make/unmake on one packed board. Same results,
+                               but nodes allocate no Grid objects, lists or tuples
+        :param ntuple_weights->str : Weight file of a trained NTupleNetwork to evaluate leaves
+                                     with instead of the heuristics
+        :param adaptive_time->bool : Budget every move by the danger of the board and the
+                                     stability of the search, instead of a flat TIME_LIMIT
+        :param position_cache->str : File of a PositionCache shared between runs. Root results
+                                     are stored there and cached moves are played without a search
+        :param position_cache_depth->int : Cached moves need at least this search depth
+        :param eval_cache_entries->int : Memoize leaf scores in a CachedEvaluator of this many
+                                         boards, keyed canonically with symmetry. 0 disables it
+        """
+        if search_mode not in SEARCH_MODES:
+            raise ValueError("Unknown search mode: " + str(search_mode))
+        if probability is None:
+            from GameManager import defaultProbability
+            probability = defaultProbability
+
+        self.search_mode = search_mode
+        self.probability = probability
+        self.prob_threshold = prob_threshold
+        self.w1 = w1
+        self.w2 = w2
+        self.w3 = w3
+        self.w4 = w4
+        if evaluator is None and ntuple_weights:
+            evaluator = NTupleNetwork.load(ntuple_weights)
+        self.evaluator = evaluator or TableEvaluator(w1, w2, w3, w4)
+        if symmetry and not self.evaluator.is_symmetric():
+            raise ValueError(SYMMETRY_ERROR)
+        if eval_cache_entries:
+            self.evaluator = CachedEvaluator(self.evaluator, eval_cache_entries, symmetry)
+        self.symmetry = symmetry
+        # Deadlines are measured on this clock, the one GameManager times turns with
+        self.clock = time.process_time
+        self.deadline = 0
+        self.nodes = 0
+        self.max_depth = 1
+        self.completed_depth = 0
+        self.pv_move = None
+        # Expectimax values of boards waiting for a tile, cleared every move
+        self.afterstates = {}
+        self.afterstate_hits = 0
+        self.generate_moves = GENERATE_MOVES
+        self.generate_cells = GENERATE_CELLS
+        self.orderer = MoveOrderer(MAX_DEPTH + 1) if move_ordering else None
+        # Kept for the whole game so later turns reuse earlier searches, entries
+        # of earlier moves are aged out
+        self.table = TranspositionTable(memoryLimitMB=table_size_mb) if table_size_mb else None
+        self.board_search = BoardSearch(self, MAX_DEPTH + 1) if inplace else None
+        self.time_bank = TimeBank() if adaptive_time else None
+        self.position_cache = (PositionCache(position_cache, fingerprint=self.config_fingerprint())
+                               if position_cache else None)
+        self.position_cache_depth = position_cache_depth
+
+    def config_fingerprint(self):
+        """ 64 bit hash of the settings that decide the value and move a search returns """
+        config = repr((self.search_mode, self.probability, self.prob_threshold, self.symmetry,
+                       self.evaluator.fingerprint()))
+        return int.from_bytes(hashlib.blake2b(config.encode(), digest_size=8).digest(), "little")
+
+    def close(self):
+        if self.position_cache is not None:
+            self.position_cache.close()
+
+    # Same score as w1*h_monotonicity + w2*h_max_tile_on_edge + w3*h_free_cells + w4*h_weight_higher_values,
+    # computed from precomputed line tables
     def evaluate_state(self, grid):
-        board = grid[1]
-        return .5*h_monotonicity(board.map) + 1*h_max_tile_on_edge(board) + h_free_cells(board) + h_weight_higher_values(board)
+        return self.evaluator.evaluate(toBoard(grid[1]))
 
     def getMove(self, grid):
-        self.time = time.process_time()
+        start = self.clock()
+        self.nodes = 0
         if grid.getMaxTile() == 2048:
             return 0
-        board, util = self.maximize((0, grid), -10000, 10000, 0)
-        return board[0]
+
+        # Fall back to the first legal move if not even depth 1 completes
+        moved = dict(grid.getAvailableMoves())
+        legal_moves = [move for move in MOVE_ORDER if move in moved]
+        best_move = legal_moves[0] if legal_moves else None
+        best_util = None
+        if self.position_cache is not None:
+            board = toBoard(grid)
+            entry = self.position_cache.lookup(board, self.position_cache_depth)
+            if entry is not None and entry[1] in moved:
+                # report the depth the cached move was searched to
+                self.completed_depth = entry[2]
+                return entry[1]
+
+        # only moves that are searched are budgeted
+        budget = self.time_bank.start_move(toBoard(grid)) if self.time_bank else TIME_LIMIT
+        self.deadline = start + budget
+        self.pv_move = None
+        self.completed_depth = 0
+        self.afterstates.clear()
+        if self.orderer:
+            self.orderer.new_search()
+        if self.table is not None:
+            self.table.new_search()
+
+        # Search one move deeper each iteration and keep the move of the last
+        # iteration that finished; an interrupted iteration is thrown away
+        for self.max_depth in range(1, MAX_DEPTH + 1, 2):
+            timed_out = False
+            try:
+                move, util = self.search_once(grid)
+            except SearchTimeout:
+                timed_out = True
+                break
+            if move is None:
+                break
+            best_move = self.pv_move = move
+            best_util = util
+            self.completed_depth = self.max_depth
+            if self.time_bank and not self.time_bank.keep_searching(self.clock() - start, move):
+                break
+
+        if self.time_bank:
+            self.time_bank.end_move(self.clock() - start, timed_out)
+        if self.position_cache is not None and self.completed_depth >= self.position_cache_depth:
+            self.position_cache.store(board, best_util, best_move, self.completed_depth)
+        return best_move
+
+    def search_once(self, grid):
+        """ Searches grid to max_depth and returns (best move, value) """
+        if self.board_search is not None:
+            return self.board_search.search(toBoard(grid))
+        if self.search_mode == "expectimax":
+            board, util = self.expectimax((0, grid), 0, 1.0)
+        else:
+            board, util = self.maximize((0, grid), -10000, 10000, 0)
+        return (board[0] if board is not None else None), util
+
+    def check_deadline(self):
+        self.nodes += 1
+        if not self.nodes % CHECK_INTERVAL and self.clock() >= self.deadline:
+            raise SearchTimeout()
 
     # Maximize the possible utility returned using alpha-beta pruning
     # Returns tuple with state of board and utility
     def maximize(self, grid, alpha, beta, depth):
         depth += 1
-        available_moves = grid[1].getAvailableMoves()
-        available_moves = [move for x in MOVE_ORDER for move in available_moves if move[0] == x and grid[1].canMove([move[0]])]
-        cur_time = time.process_time() - self.time
-        if len(available_moves) < 1 or depth > 5 or cur_time >= 0.1:
+        self.check_deadline()
+        if depth > self.max_depth:
             return grid, self.evaluate_state(grid)
-
+        available_moves = self.generate_moves(grid[1])
+        if len(available_moves) < 1:
+            return grid, self.evaluate_state(grid)
+        available_moves = [move for x in MOVE_ORDER for move in available_moves if move[0] == x]
+        if self.orderer:
+            self.orderer.order_moves(available_moves, depth)
+
+        # the previous iteration's best move goes first at the root, below it
+        # the transposition table supplies the rest of the principal variation
+        if depth == 1 and self.pv_move is not None:
+            available_moves.sort(key=lambda move: move[0] != self.pv_move)
+
+        # remaining depth below this node, so equal keys mean equal subtrees
+        remaining = self.max_depth + 1 - depth
+        key, transform = None, 0
+        if self.table is not None:
+            # symmetric boards share an entry, moves are stored in its orientation
+            if self.symmetry:
+                key, transform = canonical(toBoard(grid[1]))
+            else:
+                key = grid[1].hashKey()
+        entry = self.table.lookup(key) if key is not None else None
+        if entry is not None:
+            # try the stored best move first
+            if depth > 1:
+                stored_move = BACKWARD[transform][entry[3]]
+                available_moves.sort(key=lambda move: move[0] != stored_move)
+            # the root always searches so it has a move to return
+            if depth > 1 and entry[0] >= remaining:
+                if entry[2] == EXACT:
+                    return None, entry[1]
+                if entry[2] == LOWER:
+                    alpha = max(alpha, entry[1])
+                else:
+                    beta = min(beta, entry[1])
+                if alpha >= beta:
+                    return None, entry[1]
+
+        alpha_orig = alpha
         max_child, max_util = None, -100000
         for child in available_moves:
-            # get the minimum board value returned for this child
-            new_grid_1, min_util_2 = self.minimize(child, alpha, beta, depth, 2)
-            new_grid_2, min_util_4 = self.minimize(child, alpha, beta, depth, 4)
-            min_util = (.9*min_util_2) + (.1*min_util_4)
+            min_util = self.spawn_value(child, alpha, beta, depth)
             if min_util > max_util:
                 max_child, max_util = child, min_util
 
             if max_util >= beta:
-                return max_child, max_util
+                if self.orderer:
+                    self.orderer.record_cutoff(child[0], depth, remaining)
+                break
 
             alpha = max(alpha, max_util)
 
+        # a timeout unwinds past this point, so only finished searches are stored
+        if key is not None:
+            if max_util <= alpha_orig:
+                bound = UPPER
+            elif max_util >= beta:
+                bound = LOWER
+            else:
+                bound = EXACT
+            self.table.store(key, remaining, max_util, bound, FORWARD[transform][max_child[0]])
+
         return max_child, max_util
 
+    # Value of a moved board once the computer has placed a tile. Expectimax
+    # starts from probability 1, so it is only called that way for root moves.
+    # The minimax value mixes the worst 2 and the worst 4 spawn .9/.1, and each
+    # part is searched with the window that decides whether the mix leaves
+    # (alpha, beta). So the mix means what any alpha-beta value means: exact
+    # inside the window, otherwise a bound on the side it fell.
+    def spawn_value(self, child, alpha, beta, depth):
+        if self.search_mode == "expectimax":
+            return self.chance(child, depth, 1.0)
+        # get the minimum board value returned for this child
+        new_grid_1, min_util_2 = self.minimize(child, alpha, beta, depth, 2)
+        alpha_4, beta_4 = (alpha - .9*min_util_2) / .1, (beta - .9*min_util_2) / .1
+        new_grid_2, min_util_4 = self.minimize(child, alpha_4, beta_4, depth, 4)
+        util = (.9*min_util_2) + (.1*min_util_4)
+        if alpha < min_util_2 < beta or (min_util_2 <= alpha and util <= alpha) or (min_util_2 >= beta and util >= beta):
+            return util
+
+        # the 2 was cut off, but the 4 moved the mix off that side: search the
+        # 4 exactly, then the 2 again with the window that decides the mix
+        if not alpha_4 < min_util_4 < beta_4:
+            new_grid_2, min_util_4 = self.minimize(child, -10000, 10000, depth, 4)
+        new_grid_1, min_util_2 = self.minimize(child, (alpha - .1*min_util_4) / .9, (beta - .1*min_util_4) / .9,
+                                               depth, 2)
+        return (.9*min_util_2) + (.1*min_util_4)
+
     def minimize(self, grid, alpha, beta, depth, tile):
         depth += 1
-        available_moves = grid[1].getAvailableCells()
-        cur_time = time.process_time() - self.time
-        if len(available_moves) < 1 or cur_time >= 0.1 or depth > 5:
+        self.check_deadline()
+        if depth > self.max_depth:
             return grid, self.evaluate_state(grid)
+        available_moves = self.generate_cells(grid[1])
+        if len(available_moves) < 1:
+            return grid, self.evaluate_state(grid)
+        if self.orderer:
+            self.orderer.order_cells(grid[1], available_moves, tile)
 
         min_child, min_util = None, 100000
         for cell in available_moves:
@@ -183,3 +422,58 @@ class IntelligentAgent(BaseAI):
             beta = min(beta, min_util)
 
         return min_child, min_util
+
+    # Player node of the expectimax search
+    # Returns tuple with state of board and expected utility
+    def expectimax(self, grid, depth, prob):
+        depth += 1
+        self.check_deadline()
+        if depth > self.max_depth or prob < self.prob_threshold:
+            return grid, self.evaluate_state(grid)
+        available_moves = self.generate_moves(grid[1])
+        if len(available_moves) < 1:
+            return grid, self.evaluate_state(grid)
+        available_moves = [move for x in MOVE_ORDER for move in available_moves if move[0] == x]
+        if depth == 1 and self.pv_move is not None:
+            available_moves.sort(key=lambda move: move[0] != self.pv_move)
+
+        max_child, max_util = None, -100000
+        for child in available_moves:
+            util = self.chance(child, depth, prob)
+            if util > max_util:
+                max_child, max_util = child, util
+
+        return max_child, max_util
+
+    # Chance node: the average over every empty cell of the spawn-weighted
+    # value of placing a 2 or a 4 there
+    def chance(self, grid, depth, prob):
+        depth += 1
+        self.check_deadline()
+        if depth > self.max_depth:
+            return self.evaluate_state(grid)
+        available_cells = self.generate_cells(grid[1])
+        if len(available_cells) < 1:
+            return self.evaluate_state(grid)
+
+        # reuse an afterstate already searched at least this deep and reached
+        # at least this likely, so prob_threshold cut its subtree no more
+        remaining = self.max_depth + 1 - depth
+        key = canonical(toBoard(grid[1]))[0] if self.symmetry else grid[1].hashKey()
+        cached = self.afterstates.get(key)
+        if cached is not None and cached[0] >= remaining and cached[1] >= prob:
+            self.afterstate_hits += 1
+            return cached[2]
+
+        cell_prob = prob / len(available_cells)
+        total = 0
+        for cell in available_cells:
+            for tile, tile_prob in ((2, self.probability), (4, 1 - self.probability)):
+                next_grid = grid[1].clone()
+                next_grid.insertTile(cell, tile)
+                new_grid, util = self.expectimax((5, next_grid), depth, cell_prob * tile_prob)
+                total += tile_prob * util
+        util = total / len(available_cells)
+
+        self.afterstates[key] = (remaining, prob, util)
+        return util
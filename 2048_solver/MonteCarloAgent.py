@@ -0,0 +1,262 @@
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from BaseAI import BaseAI
+from BitGrid import MOVES, ROW_MASK, ROW_EMPTY, toBoard
+
+# Monte Carlo rollout agent for 2048. Every legal move is tried by playing
+# many fast games from the board it leads to until no move is left, and the
+# move whose playouts end with the best average score is played. Playouts run
+# on packed boards with the BitGrid move tables, round robin over the root
+# moves until the time budget of the move is spent.
+
+TIME_LIMIT = 0.1
+PLAYOUT_POLICIES = ("random", "greedy")
+MOVE_ORDER = (1, 3, 2, 0)
+# Wall time kept back for sending boards to the workers and results back
+IPC_MARGIN = 0.01
+
+ROW_SHIFTS = (0, 16, 32, 48)
+# EMPTY_SHIFTS[row] are the nibble shifts of the empty cells of a packed row
+EMPTY_SHIFTS = tuple(tuple(4 * y for y in cells) for cells in ROW_EMPTY)
+
+
+def _build_score_table():
+    # A tile 2^k built from 2s scored (k - 1) * 2^k, as in GameManager.getScore
+    table = []
+    for row in range(1 << 16):
+        score = 0
+        for i in range(4):
+            exponent = (row >> (4 * i)) & 0xF
+            if exponent > 1:
+                score += (exponent - 1) << exponent
+        table.append(score)
+    return table
+
+
+ROW_SCORE = _build_score_table()
+
+
+def board_score(board):
+    """ Score of a packed board, counting every tile as built from 2s """
+    return (ROW_SCORE[board & ROW_MASK] + ROW_SCORE[(board >> 16) & ROW_MASK]
+            + ROW_SCORE[(board >> 32) & ROW_MASK] + ROW_SCORE[(board >> 48) & ROW_MASK])
+
+
+def playout(board, rng, probability=0.9, policy="random", max_moves=None):
+    """
+    Plays a game out from a board that is waiting for a tile.
+    "random" picks a uniformly random legal move, "greedy" the move that
+    leaves the most empty cells.
+    :return (final board, number of player moves played)
+    """
+    randrange = rng.randrange
+    rand = rng.random
+    greedy = policy == "greedy"
+    moves_played = 0
+
+    while max_moves is None or moves_played < max_moves:
+        # A move that changed the board always leaves an empty cell
+        empty = 0
+        for shift in ROW_SHIFTS:
+            empty += len(EMPTY_SHIFTS[(board >> shift) & ROW_MASK])
+        if empty == 0:
+            break
+        index = randrange(empty)
+        for shift in ROW_SHIFTS:
+            cells = EMPTY_SHIFTS[(board >> shift) & ROW_MASK]
+            if index < len(cells):
+                board |= (1 if rand() < probability else 2) << (shift + cells[index])
+                break
+            index -= len(cells)
+
+        legal = [moved for moved in (MOVES[0](board), MOVES[1](board), MOVES[2](board), MOVES[3](board))
+                 if moved != board]
+        if not legal:
+            break
+        if greedy:
+            best_empty = -1
+            for moved in legal:
+                empty = 0
+                for shift in ROW_SHIFTS:
+                    empty += len(EMPTY_SHIFTS[(moved >> shift) & ROW_MASK])
+                if empty > best_empty:
+                    best_empty = empty
+                    board = moved
+        else:
+            board = legal[randrange(len(legal))]
+        moves_played += 1
+
+    return board, moves_played
+
+
+def run_playouts(children, deadline, clock, rng, probability=0.9, policy="random", max_moves=None):
+    """
+    Plays one playout per root move per round until the deadline.
+    :param children : [(move, packed board after the move), ...]
+    :return (total final score per child, playouts per child)
+    """
+    totals = [0] * len(children)
+    counts = [0] * len(children)
+    while True:
+        for i, (move, child) in enumerate(children):
+            final, moves_played = playout(child, rng, probability, policy, max_moves)
+            totals[i] += board_score(final)
+            counts[i] += 1
+        if clock() >= deadline:
+            break
+    return totals, counts
+
+
+_worker_config = None
+
+
+def _init_worker(probability, policy, max_moves):
+    global _worker_config
+    _worker_config = (probability, policy, max_moves)
+
+
+def _worker_playouts(children, deadline, seed):
+    probability, policy, max_moves = _worker_config
+    # Worker CPU time is not comparable with the parent's, so use wall time
+    return run_playouts(children, deadline, time.time, random.Random(seed), probability, policy, max_moves)
+
+
+class MonteCarloAgent(BaseAI):
+    """
+        Picks the move with the best average playout score.
+        With several workers the playouts of every move are spread over a
+        persistent pool of processes.
+    """
+    def __init__(self, policy="random", workers=1, time_limit=TIME_LIMIT, max_playout_moves=None,
+                 probability=None, seed=None):
+        """
+        :param policy->str : "random" or "greedy" playout moves
+        :param workers->int : Processes playing playouts, 1 plays them in this process
+        :param time_limit->float : Time budget of one move in seconds
+        :param max_playout_moves->int : Cut playouts off after this many moves, None plays to the end
+        :param probability->float : Chance of spawning a 2, GameManager.defaultProbability if None
+        :param seed->int : Seed of the playout random numbers, None for a random seed
+        """
+        if policy not in PLAYOUT_POLICIES:
+            raise ValueError("Unknown playout policy: " + str(policy))
+        if probability is None:
+            from GameManager import defaultProbability
+            probability = defaultProbability
+
+        self.policy = policy
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.time_limit = time_limit
+        self.max_playout_moves = max_playout_moves
+        self.probability = probability
+        self.rng = random.Random(seed)
+        # Deadlines are measured on this clock, the one GameManager times turns with
+        self.clock = time.process_time
+        self.context = multiprocessing.get_context()
+        self.pool = None
+
+        # Statistics of the last move and of the whole game
+        self.playouts = 0
+        self.total_playouts = 0
+        self.total_time = 0.0
+
+    def start_pool(self):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=self.context, initializer=_init_worker,
+                                            initargs=(self.probability, self.policy, self.max_playout_moves))
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def playouts_per_second(self):
+        return self.total_playouts / self.total_time if self.total_time else 0.0
+
+    def getMove(self, grid):
+        if grid.getMaxTile() == 2048:
+            return 0
+
+        board = toBoard(grid)
+        children = [(move, MOVES[move](board)) for move in MOVE_ORDER if MOVES[move](board) != board]
+        if len(children) < 1:
+            return None
+        if len(children) == 1:
+            return children[0][0]
+
+        start = time.perf_counter()
+        if self.workers > 1:
+            totals, counts = self.playouts_parallel(children, time.time() + self.time_limit - IPC_MARGIN)
+        else:
+            totals, counts = run_playouts(children, self.clock() + self.time_limit, self.clock, self.rng,
+                                          self.probability, self.policy, self.max_playout_moves)
+        self.playouts = sum(counts)
+        self.total_playouts += self.playouts
+        self.total_time += time.perf_counter() - start
+
+        best_move, best_util = children[0][0], -1
+        for (move, child), total, count in zip(children, totals, counts):
+            if count and total / count > best_util:
+                best_move, best_util = move, total / count
+        return best_move
+
+    def playouts_parallel(self, children, deadline):
+        """ Runs playouts for every child in every worker and adds up the results """
+        pool = self.start_pool()
+        futures = [pool.submit(_worker_playouts, children, deadline, self.rng.getrandbits(32))
+                   for _ in range(self.workers)]
+
+        totals = [0] * len(children)
+        counts = [0] * len(children)
+        for future in futures:
+            worker_totals, worker_counts = future.result()
+            for i in range(len(children)):
+                totals[i] += worker_totals[i]
+                counts[i] += worker_counts[i]
+        return totals, counts
+
+
+def compare(games=2, seed=0, **agent_kwargs):
+    """ Plays seeded games with the Monte Carlo and the minimax agent and reports their strength """
+    from BaseDisplayer import BaseDisplayer
+    from BitGrid import BitGrid
+    from ComputerAI import ComputerAI
+    from GameManager import GameManager
+    from IntelligentAgent import IntelligentAgent
+
+    for name in ("monte carlo", "minimax"):
+        tiles, scores, rates = [], [], []
+        for game in range(games):
+            random.seed(seed + game)
+            if name == "monte carlo":
+                agent = MonteCarloAgent(seed=seed + game, **agent_kwargs)
+            else:
+                agent = IntelligentAgent()
+            manager = GameManager(4, agent, ComputerAI(), BaseDisplayer(), BitGrid, verbose=False)
+            try:
+                tiles.append(manager.start())
+            finally:
+                if isinstance(agent, MonteCarloAgent):
+                    agent.close()
+            scores.append(manager.getScore())
+            if isinstance(agent, MonteCarloAgent):
+                rates.append(agent.playouts_per_second())
+
+        line = "%-12s max tiles %s  mean score %8.0f" % (name, tiles, sum(scores) / len(scores))
+        if rates:
+            line += "  %6.0f playouts/s" % (sum(rates) / len(rates))
+        print(line)
+
+
+if __name__ == '__main__':
+    compare()
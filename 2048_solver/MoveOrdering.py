@@ -0,0 +1,109 @@
+import time
+
+from BitGrid import toBoard
+
+# Adaptive move ordering for the minimax search. Player moves are ordered by
+# killer moves (the moves that last caused a beta cutoff at the same ply)
+# and then by a history score that grows with every cutoff a move causes.
+# Spawn cells are ordered most damaging first, so the min player finds the
+# refutation early and alpha cutoffs come sooner.
+
+KILLERS_PER_PLY = 2
+
+# NEIGHBOURS[cell] are the nibble shifts of the cells orthogonally next to cell
+NEIGHBOURS = tuple(
+    tuple(4 * (4 * nx + ny)
+          for nx, ny in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1))
+          if 0 <= nx < 4 and 0 <= ny < 4)
+    for x in range(4) for y in range(4))
+
+
+def spawn_damage(board, cell, exponent):
+    """
+    Cheap estimate of how much a new tile at cell hurts the player: it blocks
+    the large tiles next to it, unless it can merge with one of them.
+    """
+    damage = 0
+    for shift in NEIGHBOURS[4 * cell[0] + cell[1]]:
+        neighbour = (board >> shift) & 0xF
+        if neighbour == exponent:
+            damage -= 2 * exponent
+        else:
+            damage += neighbour
+    return damage
+
+
+class MoveOrderer:
+    """
+        Killer and history tables for one game. History is halved at the
+        start of every move so old cutoffs fade out.
+    """
+    def __init__(self, max_plies=64):
+        self.history = [0] * 4
+        self.killers = [[None] * KILLERS_PER_PLY for _ in range(max_plies + 1)]
+
+    def new_search(self):
+        self.history = [score >> 1 for score in self.history]
+        for killers in self.killers:
+            killers[:] = [None] * KILLERS_PER_PLY
+
+    def order_moves(self, available_moves, depth):
+        """ Sorts (move, grid) pairs killers first, then by history score """
+        killers = self.killers[depth]
+        history = self.history
+        available_moves.sort(key=lambda move: (move[0] not in killers, -history[move[0]]))
+        return available_moves
+
+    def record_cutoff(self, move, depth, remaining):
+        """ Credits move with a beta cutoff at ply depth with remaining plies below """
+        self.history[move] += remaining * remaining
+        killers = self.killers[depth]
+        if killers[0] != move:
+            killers[1:] = killers[:-1]
+            killers[0] = move
+
+    def order_cells(self, grid, cells, tile):
+        """ Sorts empty cells so the most damaging spawn comes first """
+        board = toBoard(grid)
+        exponent = tile.bit_length() - 1
+        cells.sort(key=lambda cell: -spawn_damage(board, cell, exponent))
+        return cells
+
+
+def benchmark(count=30, depth=7):
+    """ Compares nodes per fixed depth search and depth reached under the deadline """
+    from BitGrid import BitGrid, randomGrids
+    from IntelligentAgent import IntelligentAgent
+
+    grids = [grid for grid in randomGrids(BitGrid, 40 * count, seed=11)[::40] if grid.canMove()]
+
+    for ordering in (False, True):
+        agent = IntelligentAgent(table_size_mb=0, move_ordering=ordering)
+        agent.clock = time.perf_counter
+
+        nodes = 0
+        start = time.perf_counter()
+        for grid in grids:
+            agent.deadline = float("inf")
+            agent.pv_move = None
+            if agent.orderer:
+                agent.orderer.new_search()
+            for agent.max_depth in range(1, depth + 1, 2):
+                agent.nodes = 0
+                board, util = agent.maximize((0, grid), -10000, 10000, 0)
+                agent.pv_move = board[0]
+                nodes += agent.nodes
+        elapsed = time.perf_counter() - start
+
+        depths = []
+        for grid in grids:
+            agent.getMove(grid)
+            depths.append(agent.completed_depth)
+
+        print("%-16s %9d nodes at depth %d in %6.2f s, mean depth under deadline %.2f"
+              % ("history/killers" if ordering else "fixed order", nodes, depth, elapsed,
+                 sum(depths) / len(depths)))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,286 @@
+import argparse
+import mmap
+import os
+import random
+import struct
+import time
+import zlib
+from array import array
+from collections import deque
+
+from BitGrid import MOVES, ROW_MASK, ROW_EMPTY, toBoard
+from MonteCarloAgent import board_score
+from Symmetry import transform
+
+# Learned evaluation for 2048 with an n-tuple network. Every tuple is a fixed
+# set of cells, and the exponents in those cells index a table of weights.
+# Each tuple is read in all 8 orientations of the board with the same table
+# (symmetric sampling), so the network scores rotated and mirrored boards the
+# same. The value of a board is the sum of the looked up weights and estimates
+# the score still to come from that afterstate.
+#
+# Weights are learned offline by TD learning on afterstates from self-play
+# and stored in a binary file:
+#   header  : "NTPL", format version, number of tuples       ("<4sII")
+#   tuples  : for each, the number of cells and the cells    ("<I" + "B" * n)
+#   padding : zero bytes up to a multiple of 4
+#   weights : one float32 table of 16^n entries per tuple, native byte order
+# Loading maps the file into memory, so processes playing with the same
+# weights share one copy of the tables.
+
+MAGIC = b"NTPL"
+VERSION = 1
+CELL_VALUES = 16
+
+# Cells are numbered 4 * x + y, as in BitGrid. Two straight lines and two
+# squares are the 4-tuples of Szubert and Jaskowski's 2048 network.
+TUPLES_4 = ((0, 1, 2, 3), (4, 5, 6, 7), (0, 1, 4, 5), (4, 5, 8, 9))
+# Larger 6-tuples play better but need 4 * 16^6 floats, 256 MB, of tables
+TUPLES_6 = ((0, 1, 2, 3, 4, 5), (4, 5, 6, 7, 8, 9), (0, 1, 2, 4, 5, 6), (4, 5, 6, 8, 9, 10))
+
+ROW_SHIFTS = (0, 16, 32, 48)
+# EMPTY_SHIFTS[row] are the nibble shifts of the empty cells of a packed row
+EMPTY_SHIFTS = tuple(tuple(4 * y for y in cells) for cells in ROW_EMPTY)
+
+
+def _orientations(cells):
+    """ Nibble shifts of the cells of a tuple in each of the 8 orientations """
+    shifts = []
+    for t in range(8):
+        # Follow each cell through the transform by marking it on an empty board
+        moved = []
+        for cell in cells:
+            board = transform(1 << (4 * cell), t)
+            moved.append((board.bit_length() - 1) & ~3)
+        if tuple(moved) not in shifts:
+            shifts.append(tuple(moved))
+    return shifts
+
+
+class NTupleNetwork:
+    """
+        Tables of weights for a set of n-tuples.
+        Scores are the current board score plus the learned value, in units of
+        scale, so the agent's search sees an estimate of the final score inside
+        its usual value range.
+    """
+    def __init__(self, tuples=TUPLES_4, tables=None, scale=0.001):
+        self.tuples = tuple(tuple(cells) for cells in tuples)
+        if tables is None:
+            tables = [array('f', [0.0]) * CELL_VALUES ** len(cells) for cells in self.tuples]
+        self.tables = tables
+        self.scale = scale
+        self.mapped = None
+        # (table, shifts) for every tuple in every orientation
+        self.features = [(tables[i], shifts)
+                         for i, cells in enumerate(self.tuples)
+                         for shifts in _orientations(cells)]
+
+    def is_symmetric(self):
+        return True
+
+    def fingerprint(self):
+        """ Identifies the network: its tuples, scale and a CRC of every table """
+        return ("ntuple", self.tuples, self.scale,
+                tuple(zlib.crc32(memoryview(table).cast('B')) for table in self.tables))
+
+    def indices(self, board):
+        """ Table index of every feature of a packed board """
+        result = []
+        for table, shifts in self.features:
+            index = 0
+            for shift in shifts:
+                index = (index << 4) | ((board >> shift) & 0xF)
+            result.append(index)
+        return result
+
+    def value(self, board):
+        """ Learned value of an afterstate: the score expected from here on """
+        value = 0.0
+        for table, shifts in self.features:
+            index = 0
+            for shift in shifts:
+                index = (index << 4) | ((board >> shift) & 0xF)
+            value += table[index]
+        return value
+
+    def evaluate(self, board):
+        """ Returns the estimated final score of a packed board, times scale """
+        return self.scale * (board_score(board) + self.value(board))
+
+    def evaluate_grid(self, grid):
+        return self.evaluate(toBoard(grid))
+
+    def save(self, path):
+        """ Writes the tuples and weights in the binary format described at the top """
+        with open(path, "wb") as f:
+            header = struct.pack("<4sII", MAGIC, VERSION, len(self.tuples))
+            for cells in self.tuples:
+                header += struct.pack("<I%dB" % len(cells), len(cells), *cells)
+            header += bytes(-len(header) % 4)
+            f.write(header)
+            for table in self.tables:
+                f.write(memoryview(table).cast('B'))
+
+    @classmethod
+    def load(cls, path, writable=False, scale=0.001):
+        """
+        Maps a weight file into memory.
+        :param writable->bool : Copy the tables into arrays that can be trained further,
+                                otherwise they are read only views of the mapped file
+        """
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count = struct.unpack_from("<4sII", mapped, 0)
+        if magic != MAGIC or version != VERSION:
+            mapped.close()
+            raise ValueError("%s is not an n-tuple weight file of version %d" % (path, VERSION))
+        offset = struct.calcsize("<4sII")
+        tuples = []
+        for _ in range(count):
+            length, = struct.unpack_from("<I", mapped, offset)
+            tuples.append(struct.unpack_from("<%dB" % length, mapped, offset + 4))
+            offset += 4 + length
+        offset += -offset % 4
+
+        view = memoryview(mapped)
+        tables = []
+        for cells in tuples:
+            size = 4 * CELL_VALUES ** len(cells)
+            table = view[offset:offset + size].cast('f')
+            if writable:
+                tables.append(array('f', table))
+                table.release()
+            else:
+                tables.append(table)
+            offset += size
+
+        network = cls(tuples, tables, scale)
+        if writable:
+            view.release()
+            mapped.close()
+        else:
+            network.mapped = mapped
+        return network
+
+
+class TDTrainer:
+    """
+        Trains a network by TD(lambda) on afterstates from self-play.
+        Every move is picked greedily by reward + value of the afterstate, and
+        the TD error of each afterstate is credited to the last horizon
+        afterstates with weights lambda^i. lam=0 is plain TD(0).
+    """
+    def __init__(self, network, alpha=0.1, lam=0.0, horizon=5, probability=0.9, seed=None):
+        self.network = network
+        # The step is shared by all features of a board
+        self.alpha = alpha / len(network.features)
+        self.lam = lam
+        self.horizon = horizon if lam else 1
+        self.probability = probability
+        self.rng = random.Random(seed)
+        self.games = 0
+
+    def spawn(self, board):
+        """ Places a random tile on an empty cell of a packed board """
+        rng = self.rng
+        empty = 0
+        for shift in ROW_SHIFTS:
+            empty += len(EMPTY_SHIFTS[(board >> shift) & ROW_MASK])
+        index = rng.randrange(empty)
+        for shift in ROW_SHIFTS:
+            cells = EMPTY_SHIFTS[(board >> shift) & ROW_MASK]
+            if index < len(cells):
+                return board | ((1 if rng.random() < self.probability else 2) << (shift + cells[index]))
+            index -= len(cells)
+        return board
+
+    def update(self, history, error):
+        """ Moves the values of recent afterstates towards their targets """
+        tables = [table for table, shifts in self.network.features]
+        step = self.alpha * error
+        for indices in reversed(history):
+            for table, index in zip(tables, indices):
+                table[index] += step
+            step *= self.lam
+
+    def stored_value(self, indices):
+        total = 0.0
+        for (table, shifts), index in zip(self.network.features, indices):
+            total += table[index]
+        return total
+
+    def play_game(self):
+        """ Plays and learns from one game, returns (score, max tile exponent) """
+        network = self.network
+        board = self.spawn(self.spawn(0))
+        history = deque(maxlen=self.horizon)
+        score = 0
+
+        while True:
+            best_after, best_reward, best_q = None, 0, None
+            for move in MOVES:
+                after = move(board)
+                if after == board:
+                    continue
+                reward = board_score(after) - board_score(board)
+                q = reward + network.value(after)
+                if best_q is None or q > best_q:
+                    best_after, best_reward, best_q = after, reward, q
+
+            if best_after is None:
+                # Nothing follows the last afterstate, its value is 0
+                if history:
+                    self.update(history, -self.stored_value(history[-1]))
+                break
+
+            if history:
+                self.update(history, best_q - self.stored_value(history[-1]))
+            history.append(network.indices(best_after))
+            score += best_reward
+            board = self.spawn(best_after)
+
+        self.games += 1
+        return score, max((board >> shift) & 0xF for shift in range(0, 64, 4))
+
+    def train(self, games, report=1000, checkpoint=None):
+        """ Plays games, printing mean score and 2048 rate every report games """
+        scores, wins = [], 0
+        start = time.perf_counter()
+        for game in range(1, games + 1):
+            score, top = self.play_game()
+            scores.append(score)
+            wins += top >= 11
+            if game % report == 0 or game == games:
+                print("games %7d  mean score %8.0f  2048 rate %5.1f%%  %6.1f games/s"
+                      % (self.games, sum(scores) / len(scores), 100 * wins / len(scores),
+                         len(scores) / (time.perf_counter() - start)))
+                scores, wins = [], 0
+                start = time.perf_counter()
+                if checkpoint:
+                    self.network.save(checkpoint)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train an n-tuple network for 2048 by TD learning")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--alpha", type=float, default=0.1, help="learning rate per board")
+    parser.add_argument("--lam", type=float, default=0.0, help="trace decay, 0 for TD(0)")
+    parser.add_argument("--horizon", type=int, default=5, help="afterstates credited with each TD error")
+    parser.add_argument("--tuples", choices=("4", "6"), default="4", help="network of 4-tuples or 6-tuples")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--report", type=int, default=1000)
+    parser.add_argument("--output", default="ntuple.bin", help="weight file, resumed from if it exists")
+    args = parser.parse_args()
+
+    if os.path.exists(args.output):
+        network = NTupleNetwork.load(args.output, writable=True)
+    else:
+        network = NTupleNetwork(TUPLES_4 if args.tuples == "4" else TUPLES_6)
+    trainer = TDTrainer(network, args.alpha, args.lam, args.horizon, seed=args.seed)
+    trainer.train(args.games, args.report, args.output)
+
+
+if __name__ == '__main__':
+    main()
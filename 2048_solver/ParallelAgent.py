@@ -0,0 +1,185 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from IntelligentAgent import IntelligentAgent, SearchTimeout, MOVE_ORDER, MAX_DEPTH, TIME_LIMIT
+
+# Parallel root search for the 2048 agent. The parent deepens the search one
+# depth per round: every round sends each legal root move to a worker process,
+# searched to that depth, and waits for all of them before the next round. The
+# workers share a wall-clock deadline, and for every depth they publish the
+# best root value found so far so the other workers can use it as their alpha
+# bound.
+
+# Wall time kept back for sending boards to the workers and results back
+IPC_MARGIN = 0.01
+NO_VALUE = -100000
+
+_worker_agent = None
+_shared_alpha = None
+_search_id = None
+
+
+def _init_worker(agent_kwargs, shared_alpha):
+    global _worker_agent, _shared_alpha
+    _worker_agent = IntelligentAgent(**agent_kwargs)
+    # Worker CPU time is not comparable with the parent's, so use wall time
+    _worker_agent.clock = time.time
+    _shared_alpha = shared_alpha
+
+
+def _search_root_move(move, grid, deadline, depth, search_id):
+    """
+    Searches the subtree below one root move to depth.
+    :param search_id->int : Changes with every root position, so the worker knows
+                            when to reset its per-move state
+    :return (move, value or None if the deadline passed first, nodes searched)
+    """
+    global _search_id
+    agent = _worker_agent
+    if search_id != _search_id:
+        _search_id = search_id
+        agent.afterstates.clear()
+        if agent.orderer:
+            agent.orderer.new_search()
+        if agent.table is not None:
+            agent.table.new_search()
+
+    agent.deadline = deadline
+    agent.nodes = 0
+    agent.max_depth = depth
+    alpha = _shared_alpha[depth]
+    try:
+        value = agent.spawn_value((move, grid), alpha, 10000, 1)
+    except SearchTimeout:
+        return move, None, agent.nodes
+
+    with _shared_alpha.get_lock():
+        if value > _shared_alpha[depth]:
+            _shared_alpha[depth] = value
+
+    return move, value, agent.nodes
+
+
+class ParallelIntelligentAgent(IntelligentAgent):
+    """
+        IntelligentAgent that searches the root moves in a persistent pool of
+        worker processes. Takes the same keyword arguments as IntelligentAgent.
+    """
+    def __init__(self, workers=None, **agent_kwargs):
+        super().__init__(**agent_kwargs)
+        self.agent_kwargs = agent_kwargs
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.context = multiprocessing.get_context()
+        self.shared_alpha = self.context.Array('d', MAX_DEPTH + 2)
+        self.pool = None
+        self.search_id = 0
+        self.last_depth = 0
+
+    def start_pool(self):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=self.context, initializer=_init_worker,
+                                            initargs=(self.agent_kwargs, self.shared_alpha))
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        super().close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def getMove(self, grid):
+        if grid.getMaxTile() == 2048:
+            return 0
+
+        # Stay inside GameManager's limit on the wall clock, which also bounds
+        # the parent's own CPU time
+        deadline = time.time() + TIME_LIMIT - IPC_MARGIN
+        return self.search_parallel(grid, deadline, MAX_DEPTH)
+
+    def search_parallel(self, grid, deadline, max_depth):
+        available_moves = grid.getAvailableMoves()
+        available_moves = [move for x in MOVE_ORDER for move in available_moves if move[0] == x]
+        if len(available_moves) < 1:
+            return None
+        if len(available_moves) == 1:
+            return available_moves[0][0]
+
+        self.search_id += 1
+        with self.shared_alpha.get_lock():
+            for i in range(len(self.shared_alpha)):
+                self.shared_alpha[i] = NO_VALUE
+
+        pool = self.start_pool()
+        best_move = available_moves[0][0]
+        self.nodes = 0
+        self.last_depth = self.completed_depth = 0
+        for depth in range(1, max_depth + 1, 2):
+            if time.time() >= deadline:
+                break
+            futures = [pool.submit(_search_root_move, move, child, deadline, depth, self.search_id)
+                       for move, child in available_moves]
+            results = [future.result() for future in futures]
+            self.nodes += sum(nodes for move, value, nodes in results)
+
+            # Only a depth every root move finished is compared
+            if any(value is None for move, value, nodes in results):
+                break
+            self.last_depth = self.completed_depth = depth
+
+            # Best move first in the next round, so its value is published as
+            # the other moves' alpha as early as possible. Ties keep their order
+            ranked = sorted(zip(results, available_moves), key=lambda pair: -pair[0][1])
+            best_move = ranked[0][0][0]
+            available_moves = [move for result, move in ranked]
+
+        return best_move
+
+
+def compare_with_serial(count=10, depth=7, workers=None, **agent_kwargs):
+    """ Reports the wall time speedup of the parallel search at a fixed depth """
+    from BitGrid import BitGrid, randomGrids
+
+    grids = [grid for grid in randomGrids(BitGrid, 40 * count, seed=1)[::40] if grid.canMove()]
+    serial = IntelligentAgent(**agent_kwargs)
+    serial.clock = time.time
+
+    start = time.time()
+    serial_moves = []
+    for grid in grids:
+        # deepen the same way the workers do
+        serial.deadline = float("inf")
+        serial.pv_move = None
+        serial.afterstates.clear()
+        for serial.max_depth in range(1, depth + 1, 2):
+            if serial.search_mode == "expectimax":
+                board, util = serial.expectimax((0, grid), 0, 1.0)
+            else:
+                board, util = serial.maximize((0, grid), -10000, 10000, 0)
+            serial.pv_move = board[0]
+        serial_moves.append(serial.pv_move)
+    serial_time = time.time() - start
+
+    with ParallelIntelligentAgent(workers, **agent_kwargs) as parallel:
+        parallel.search_parallel(grids[0], float("inf"), 1)
+        start = time.time()
+        parallel_moves = [parallel.search_parallel(grid, float("inf"), depth) for grid in grids]
+        parallel_time = time.time() - start
+
+    agree = sum(a == b for a, b in zip(serial_moves, parallel_moves))
+    print("Positions: %d at depth %d with %d workers" % (len(grids), depth, parallel.workers))
+    print("Serial:    %8.3f s" % serial_time)
+    print("Parallel:  %8.3f s" % parallel_time)
+    print("Speedup:   %8.2fx" % (serial_time / parallel_time))
+    print("Same move: %d/%d" % (agree, len(grids)))
+
+
+if __name__ == '__main__':
+    compare_with_serial()
@@ -0,0 +1,238 @@
+import argparse
+import mmap
+import os
+import struct
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows has no flock, writers are not locked against each other there
+    fcntl = None
+
+# Persistent cache of root search results shared by every run and process.
+# The cache is a fixed-size open-addressed hash table in a file that every
+# user maps into memory:
+#   header : "P48C", format version, number of slots (a power of two),
+#            fingerprint of the agent configuration                    ("<4sIIQ")
+#   slots  : packed board, value, best move, depth, check               ("<QfbBH")
+# A slot with board 0 is empty, and a board lives in one of the MAX_PROBES
+# slots following its hash. Readers only ever read the mapping, so any
+# number of processes can probe it at once. Results are buffered per process
+# and written back in batches by flush(), under an exclusive file lock. The
+# check field is a CRC of the rest of the slot, so a reader that races a
+# writer sees a miss rather than a torn entry. Results depend on the search
+# mode and evaluation of the agent, so a file only serves agents with the
+# fingerprint it was created with.
+
+MAGIC = b"P48C"
+VERSION = 2
+HEADER = struct.Struct("<4sIIQ")
+SLOT = struct.Struct("<QfbBH")
+MAX_PROBES = 8
+# Buffered results that trigger a write back
+FLUSH_EVERY = 256
+
+
+def _hash(board: int) -> int:
+    # Fibonacci hashing spreads boards that differ in a few nibbles
+    return ((board * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 32
+
+
+def _check(data) -> int:
+    return zlib.crc32(data) & 0xFFFF
+
+
+class PositionCache:
+    """
+        Memory-mapped table from a packed board to (value, best move, depth)
+        of a finished root search. A result only replaces the stored one for
+        the same board if it was searched at least as deep.
+    """
+    def __init__(self, path: str, slots: int=1 << 20, writable: bool=True, fingerprint: int=0):
+        """
+        :param path->str : Cache file, created with slots empty slots if it does not exist
+        :param slots->int : Number of slots of a new file, rounded up to a power of two
+        :param writable->bool : Buffer results and write them back, otherwise only read
+        :param fingerprint->int : Configuration of the agent using the cache, see
+                                  IntelligentAgent.config_fingerprint. The file must match it
+        """
+        if not os.path.exists(path):
+            PositionCache.create(path, slots, fingerprint)
+
+        self.path     = path
+        self.writable = writable
+        self.file     = open(path, "r+b" if writable else "rb")
+        self.map      = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+
+        magic, version, self.slots, storedFingerprint = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION or storedFingerprint != fingerprint:
+            self.map.close()
+            self.file.close()
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("%s is not a position cache of version %d" % (path, VERSION))
+            raise ValueError("%s was filled by an agent with a different configuration" % path)
+        self.fingerprint = fingerprint
+        self.mask    = self.slots - 1
+        self.pending = {}
+        self.probes  = 0
+        self.hits    = 0
+
+    @staticmethod
+    def create(path: str, slots: int=1 << 20, fingerprint: int=0) -> None:
+        """
+        Creates an empty cache file unless path already exists. The file is
+        written under a temporary name and linked into place, so processes
+        racing to create it never truncate a file another one has mapped.
+        """
+        slots = 1 << max(0, slots - 1).bit_length()
+        tempPath = "%s.%d.tmp" % (path, os.getpid())
+        with open(tempPath, "wb") as cacheFile:
+            cacheFile.write(HEADER.pack(MAGIC, VERSION, slots, fingerprint))
+            # Empty slots are zero, so the file can stay sparse
+            cacheFile.truncate(HEADER.size + SLOT.size * slots)
+        try:
+            os.link(tempPath, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tempPath)
+
+    def _offset(self, index: int) -> int:
+        return HEADER.size + SLOT.size * (index & self.mask)
+
+    def _read(self, board: int):
+        """ Returns (value, move, depth) stored in the file for board, or None """
+        index = _hash(board)
+        for i in range(MAX_PROBES):
+            offset = self._offset(index + i)
+            key, value, move, depth, check = SLOT.unpack_from(self.map, offset)
+            if key == 0:
+                return None
+            if key == board:
+                if check != _check(self.map[offset:offset + SLOT.size - 2]):
+                    return None
+                return value, move, depth
+        return None
+
+    def lookup(self, board: int, minDepth: int=0):
+        """ Returns (value, move, depth) for board if it was searched at least minDepth deep, or None """
+        self.probes += 1
+        entry = self.pending.get(board) or self._read(board)
+        if entry is None or entry[2] < minDepth:
+            return None
+        self.hits += 1
+        return entry
+
+    def store(self, board: int, value: float, move: int, depth: int) -> None:
+        """ Buffers a search result for the next write back """
+        if not self.writable or board == 0:
+            return
+        entry = self.pending.get(board)
+        if entry is None or depth >= entry[2]:
+            self.pending[board] = (value, move, depth)
+        if len(self.pending) >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self) -> None:
+        """ Writes the buffered results into the file under an exclusive lock """
+        if not self.pending:
+            return
+        if fcntl:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        try:
+            for board, (value, move, depth) in self.pending.items():
+                self._write(board, value, move, depth)
+            self.map.flush()
+        finally:
+            if fcntl:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        self.pending.clear()
+
+    def _write(self, board: int, value: float, move: int, depth: int) -> None:
+        index = _hash(board)
+        target, shallowest = None, None
+        for i in range(MAX_PROBES):
+            offset = self._offset(index + i)
+            key, _, _, storedDepth, _ = SLOT.unpack_from(self.map, offset)
+            if key == board:
+                if depth < storedDepth:
+                    return
+                target = offset
+                break
+            if key == 0:
+                target = offset
+                break
+            if shallowest is None or storedDepth < shallowest[0]:
+                shallowest = (storedDepth, offset)
+
+        # All probed slots hold other boards: replace the shallowest one
+        if target is None:
+            if shallowest[0] > depth:
+                return
+            target = shallowest[1]
+
+        data = SLOT.pack(board, value, move, min(depth, 0xFF), 0)[:-2]
+        self.map[target:target + SLOT.size] = data + struct.pack("<H", _check(data))
+
+    def hitRate(self) -> float:
+        return self.hits / self.probes if self.probes else 0.0
+
+    def count(self) -> int:
+        """ Number of boards in the file, scans every slot """
+        return sum(1 for i in range(self.slots) if SLOT.unpack_from(self.map, self._offset(i))[0])
+
+    def close(self) -> None:
+        if self.writable and not self.map.closed:
+            self.flush()
+        self.map.close()
+        self.file.close()
+
+
+def warm(cachePath: str, recordPath: str, agent_kwargs=None, depth: int=None) -> int:
+    """
+    Fills a cache from recorded games.
+    :param agent_kwargs->dict : With depth, searches every recorded position with this agent
+    :param depth->int : Fixed search depth; None stores the recorded moves with their recorded depths
+    :return number of positions stored
+    """
+    from BitGrid import toBoard
+    from GameRecord import read_records
+    from IntelligentAgent import IntelligentAgent
+
+    # Recorded moves are taken to come from an agent configured by agent_kwargs
+    agent = IntelligentAgent(**(agent_kwargs or {}))
+    cache = PositionCache(cachePath, fingerprint=agent.config_fingerprint())
+    stored = 0
+    try:
+        for record in read_records(recordPath):
+            for grid, move, stats in record.replay():
+                if depth:
+                    agent.clock = time.perf_counter
+                    agent.deadline = float("inf")
+                    agent.afterstates.clear()
+                    for agent.max_depth in range(1, depth + 1, 2):
+                        move, value = agent.search_once(grid)
+                    cache.store(toBoard(grid), value, move, depth)
+                elif stats is not None:
+                    # The recorded search did not keep its value
+                    cache.store(toBoard(grid), float("nan"), move, stats[1])
+                else:
+                    continue
+                stored += 1
+    finally:
+        cache.close()
+    return stored
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm a position cache from recorded games")
+    parser.add_argument("cache")
+    parser.add_argument("records")
+    parser.add_argument("--depth", type=int, default=None, help="search positions again to this depth")
+    args = parser.parse_args()
+    print("Stored %d positions" % warm(args.cache, args.records, depth=args.depth))
+
+
+if __name__ == '__main__':
+    main()
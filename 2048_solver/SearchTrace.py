@@ -0,0 +1,177 @@
+import json
+import time
+
+from IntelligentAgent import GENERATE_MOVES, GENERATE_CELLS
+from ParallelAgent import ParallelIntelligentAgent
+
+# Per-move search instrumentation for IntelligentAgent. attach() shadows the
+# agent's search methods with counting and timing wrappers on that one
+# instance, so an agent without a trace runs the plain methods and pays
+# nothing. Every getMove appends one JSON line to the trace file, and
+# move_number starts again at 1 with every game traced into the same file.
+# Agents whose search never reaches those methods in this process, the
+# make/unmake BoardSearch and the parallel agent's workers, are refused
+# rather than traced with empty counters.
+
+NODE_TYPES = ("max", "min", "chance")
+
+
+class SearchTrace:
+    """
+        Collects search statistics of an IntelligentAgent and streams one
+        JSON record per move.
+        :param output : Path of the JSON-lines file, or an open text file
+    """
+    def __init__(self, output):
+        self.own_file = isinstance(output, str)
+        self.file = open(output, "a") if self.own_file else output
+        self.move_number = 0
+        self.reset()
+
+    def reset(self):
+        self.nodes = dict.fromkeys(NODE_TYPES, 0)
+        # beta and alpha cutoffs, returns decided by the transposition table,
+        # and nodes above the depth limit without any move
+        self.cutoffs = 0
+        self.tt_cutoffs = 0
+        self.terminal_nodes = 0
+        self.leaf_evaluations = 0
+        self.max_depth = 0
+        self.movegen_time = 0.0
+        self.eval_time = 0.0
+
+    def close(self):
+        if self.own_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+    def attach(self, agent):
+        """ Instruments agent; recursive calls go through the wrappers as well """
+        if isinstance(agent, ParallelIntelligentAgent):
+            raise ValueError("SearchTrace cannot instrument a ParallelIntelligentAgent, "
+                             "its search runs in worker processes")
+        if agent.board_search is not None:
+            raise ValueError("SearchTrace cannot instrument an agent with inplace=True, "
+                             "BoardSearch does not call the traced methods")
+        clock = time.perf_counter
+        maximize, minimize = agent.maximize, agent.minimize
+        expectimax, chance = agent.expectimax, agent.chance
+        evaluate_state = agent.evaluate_state
+        generate_moves, generate_cells = agent.generate_moves, agent.generate_cells
+        get_move = agent.getMove
+
+        def traced_maximize(grid, alpha, beta, depth):
+            self.nodes["max"] += 1
+            if depth + 1 > self.max_depth:
+                self.max_depth = depth + 1
+            result = maximize(grid, alpha, beta, depth)
+            if depth < agent.max_depth:
+                if result[0] is None:
+                    self.tt_cutoffs += 1
+                elif result[0] is grid:
+                    self.terminal_nodes += 1
+                elif result[1] >= beta:
+                    self.cutoffs += 1
+            return result
+
+        def traced_minimize(grid, alpha, beta, depth, tile):
+            self.nodes["min"] += 1
+            if depth + 1 > self.max_depth:
+                self.max_depth = depth + 1
+            result = minimize(grid, alpha, beta, depth, tile)
+            if depth < agent.max_depth:
+                if result[0] is grid:
+                    self.terminal_nodes += 1
+                elif result[1] <= alpha:
+                    self.cutoffs += 1
+            return result
+
+        def traced_expectimax(grid, depth, prob):
+            self.nodes["max"] += 1
+            if depth + 1 > self.max_depth:
+                self.max_depth = depth + 1
+            result = expectimax(grid, depth, prob)
+            if result[0] is grid and depth < agent.max_depth and prob >= agent.prob_threshold:
+                self.terminal_nodes += 1
+            return result
+
+        def traced_chance(grid, depth, prob):
+            self.nodes["chance"] += 1
+            if depth + 1 > self.max_depth:
+                self.max_depth = depth + 1
+            return chance(grid, depth, prob)
+
+        def traced_evaluate_state(grid):
+            start = clock()
+            score = evaluate_state(grid)
+            self.eval_time += clock() - start
+            self.leaf_evaluations += 1
+            return score
+
+        def traced_generate_moves(grid):
+            start = clock()
+            moves = generate_moves(grid)
+            self.movegen_time += clock() - start
+            return moves
+
+        def traced_generate_cells(grid):
+            start = clock()
+            cells = generate_cells(grid)
+            self.movegen_time += clock() - start
+            return cells
+
+        def traced_get_move(grid):
+            self.reset()
+            table = agent.table
+            probes, hits = (table.probes, table.hits) if table is not None else (0, 0)
+            afterstate_hits = agent.afterstate_hits
+            cache = agent.position_cache
+            cache_hits = cache.hits if cache is not None else 0
+
+            start = clock()
+            move = get_move(grid)
+            elapsed = clock() - start
+
+            self.move_number += 1
+            record = {
+                "move_number": self.move_number,
+                "move": move,
+                "elapsed": elapsed,
+                "nodes": self.nodes,
+                "cutoffs": self.cutoffs,
+                "tt_cutoffs": self.tt_cutoffs,
+                "terminal_nodes": self.terminal_nodes,
+                "leaf_evaluations": self.leaf_evaluations,
+                "max_depth": self.max_depth,
+                "completed_depth": agent.completed_depth,
+                "movegen_time": self.movegen_time,
+                "eval_time": self.eval_time,
+                "tt_hit_rate": None,
+                "afterstate_hit_rate": None,
+                "position_cache_hit": cache.hits > cache_hits if cache is not None else None,
+            }
+            if table is not None and table.probes > probes:
+                record["tt_hit_rate"] = (table.hits - hits) / (table.probes - probes)
+            if self.nodes["chance"]:
+                record["afterstate_hit_rate"] = (agent.afterstate_hits - afterstate_hits) / self.nodes["chance"]
+            self.file.write(json.dumps(record) + "\n")
+            return move
+
+        agent.maximize = traced_maximize
+        agent.minimize = traced_minimize
+        agent.expectimax = traced_expectimax
+        agent.chance = traced_chance
+        agent.evaluate_state = traced_evaluate_state
+        agent.generate_moves = traced_generate_moves
+        agent.generate_cells = traced_generate_cells
+        agent.getMove = traced_get_move
+        return agent
+
+    @staticmethod
+    def detach(agent):
+        """ Removes the wrappers so the agent runs its plain methods again """
+        for name in ("maximize", "minimize", "expectimax", "chance", "evaluate_state", "getMove"):
+            agent.__dict__.pop(name, None)
+        agent.generate_moves = GENERATE_MOVES
+        agent.generate_cells = GENERATE_CELLS
@@ -0,0 +1,149 @@
+import time
+
+from BitGrid import BitGrid, ROW_MASK, SPREAD, MOVES, reverseRow, randomGrids
+from Grid import UP, DOWN, LEFT, RIGHT, vecIndex
+
+# Dihedral symmetries of a packed 4x4 board. Transform t is a combination of
+# three reflections, applied in this order:
+#   t & 4 : transpose (swap rows and columns)
+#   t & 1 : mirror left-right
+#   t & 2 : mirror up-down
+# Transform 0 is the identity and together the 8 transforms cover every
+# rotation and reflection of the board.
+
+REVERSE = [reverseRow(row) for row in range(1 << 16)]
+
+
+def transposeBoard(board: int) -> int:
+    return (SPREAD[board & ROW_MASK] | (SPREAD[(board >> 16) & ROW_MASK] << 4)
+            | (SPREAD[(board >> 32) & ROW_MASK] << 8) | (SPREAD[(board >> 48) & ROW_MASK] << 12))
+
+
+def mirrorLeftRight(board: int) -> int:
+    return (REVERSE[board & ROW_MASK] | (REVERSE[(board >> 16) & ROW_MASK] << 16)
+            | (REVERSE[(board >> 32) & ROW_MASK] << 32) | (REVERSE[(board >> 48) & ROW_MASK] << 48))
+
+
+def mirrorUpDown(board: int) -> int:
+    return (((board & ROW_MASK) << 48) | (((board >> 16) & ROW_MASK) << 32)
+            | (((board >> 32) & ROW_MASK) << 16) | (board >> 48))
+
+
+def transform(board: int, t: int) -> int:
+    """ Returns the board seen through transform t """
+    if t & 4:
+        board = transposeBoard(board)
+    if t & 1:
+        board = mirrorLeftRight(board)
+    if t & 2:
+        board = mirrorUpDown(board)
+    return board
+
+
+def _mapDirection(direction: int, t: int) -> int:
+    if t & 4:
+        direction = {UP: LEFT, LEFT: UP, DOWN: RIGHT, RIGHT: DOWN}[direction]
+    if t & 1:
+        direction = {LEFT: RIGHT, RIGHT: LEFT}.get(direction, direction)
+    if t & 2:
+        direction = {UP: DOWN, DOWN: UP}.get(direction, direction)
+    return direction
+
+
+# FORWARD[t][move] is the move in the transformed frame that does what move
+# does in the original one; BACKWARD[t] undoes it
+FORWARD = tuple(tuple(_mapDirection(direction, t) for direction in vecIndex) for t in range(8))
+BACKWARD = tuple(tuple(FORWARD[t].index(direction) for direction in vecIndex) for t in range(8))
+
+
+def canonical(board: int):
+    """
+    Returns (canonical board, t): the smallest of the 8 symmetric forms of board
+    and the transform t with transform(board, t) == canonical board.
+    """
+    h = mirrorLeftRight(board)
+    s = transposeBoard(board)
+    sh = mirrorLeftRight(s)
+    forms = (board, h, mirrorUpDown(board), mirrorUpDown(h), s, sh, mirrorUpDown(s), mirrorUpDown(sh))
+
+    best = board
+    best_t = 0
+    for t in range(1, 8):
+        if forms[t] < best:
+            best = forms[t]
+            best_t = t
+    return best, best_t
+
+
+def canonicalKey(board: int) -> int:
+    """ Same board for every symmetric form, for caches that do not need the transform """
+    return canonical(board)[0]
+
+
+def _searchBoards(board: int, depth: int, visit) -> None:
+    """ Visits every board a fixed depth search would expand below a player node """
+    visit(board)
+    if depth == 0:
+        return
+    for move in vecIndex:
+        moved = MOVES[move](board)
+        if moved == board:
+            continue
+        for cell in range(16):
+            if (moved >> (4 * cell)) & 0xF == 0:
+                for exponent in (1, 2):
+                    _searchBoards(moved | (exponent << (4 * cell)), depth - 1, visit)
+
+
+def check() -> None:
+    """ Checks that transforms commute with moves in the mapped direction """
+    for grid in randomGrids(BitGrid, 2000, seed=3):
+        board = grid.board
+        canon, t = canonical(board)
+        if transform(board, t) != canon:
+            raise AssertionError("canonical transform mismatch")
+        for direction in vecIndex:
+            moved = transform(MOVES[direction](board), t)
+            if MOVES[FORWARD[t][direction]](canon) != moved:
+                raise AssertionError("move mapping mismatch for transform %d" % t)
+            if BACKWARD[t][FORWARD[t][direction]] != direction:
+                raise AssertionError("backward mapping mismatch for transform %d" % t)
+        for s in range(8):
+            if canonical(transform(board, s))[0] != canon:
+                raise AssertionError("canonical form differs between symmetric boards")
+
+
+def benchmark(positions: int=30, depth: int=2) -> None:
+    """ Reports cache hit rates with raw and canonical keys and the canonicalization cost """
+    check()
+    grids = randomGrids(BitGrid, 50 * positions, seed=7)[::50]
+
+    boards = []
+    for grid in grids:
+        _searchBoards(grid.board, depth, boards.append)
+
+    raw_seen, canonical_seen = set(), set()
+    raw_hits = canonical_hits = 0
+    for board in boards:
+        if board in raw_seen:
+            raw_hits += 1
+        raw_seen.add(board)
+        key = canonicalKey(board)
+        if key in canonical_seen:
+            canonical_hits += 1
+        canonical_seen.add(key)
+
+    start = time.perf_counter()
+    for board in boards:
+        canonical(board)
+    cost = (time.perf_counter() - start) / len(boards)
+
+    print("Boards visited:       %d" % len(boards))
+    print("Raw key hit rate:     %.1f%%" % (100 * raw_hits / len(boards)))
+    print("Canonical hit rate:   %.1f%%" % (100 * canonical_hits / len(boards)))
+    print("Distinct entries:     %d raw, %d canonical" % (len(raw_seen), len(canonical_seen)))
+    print("Canonicalization:     %.2f us/node" % (1e6 * cost))
+
+
+if __name__ == '__main__':
+    benchmark()
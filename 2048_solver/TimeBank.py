@@ -0,0 +1,110 @@
+from BitGrid import MOVES, countEmpty, maxExponent
+
+# Adaptive move budgets for IntelligentAgent. Every move gets a soft budget
+# that grows with the danger of the board: few free cells, no merges and a
+# large tile at stake all make a wrong move more costly. Iterative deepening
+# only starts an iteration that is predicted to finish inside the soft budget,
+# or inside the extended budget while the best move is still changing. The
+# hard budget is the search deadline and stays below GameManager's per-turn
+# limit, so a mispredicted iteration never costs the game.
+
+MIN_BUDGET = 0.02
+SOFT_BUDGET = 0.1
+# GameManager.timeLimit is 0.2 s per turn, the rest is left for the game itself
+HARD_BUDGET = 0.15
+# An unstable best move may search on until this multiple of its soft budget
+EXTENSION = 1.5
+# Assumed ratio of an iteration's time to the previous one's until two are measured
+DEFAULT_GROWTH = 6
+# Boards with this many free cells or more count as open
+OPEN_CELLS = 8
+WIN_EXPONENT = 11
+
+
+def danger(board):
+    """ How critical a packed board is, from 0 (wide open) to 1 (nearly lost) """
+    empty = countEmpty(board)
+    merges = 0
+    for move in MOVES:
+        if countEmpty(move(board)) > empty:
+            merges += 1
+
+    crowded = 1 - min(empty, OPEN_CELLS) / OPEN_CELLS
+    stuck = 1 - merges / 4
+    stake = min(maxExponent(board), WIN_EXPONENT) / WIN_EXPONENT
+    return .6*crowded + .25*stuck + .15*stake
+
+
+class TimeBank:
+    """
+        Hands out per-move budgets and keeps track of how they were spent.
+        :param min_budget->float : Soft budget of the safest boards in seconds
+        :param soft_budget->float : Soft budget of the most dangerous boards
+        :param hard_budget->float : No search runs longer than this
+    """
+    def __init__(self, min_budget=MIN_BUDGET, soft_budget=SOFT_BUDGET, hard_budget=HARD_BUDGET):
+        self.min_budget = min_budget
+        self.soft_budget = soft_budget
+        self.hard_budget = hard_budget
+        self.soft = soft_budget
+        self.last_move = None
+        self.previous_elapsed = 0.0
+        self.last_iteration = 0.0
+
+        # Statistics of the whole game
+        self.moves = 0
+        self.budgeted = 0.0
+        self.used = 0.0
+        self.extensions = 0
+        self.early_stops = 0
+        self.timeouts = 0
+
+    def start_move(self, board):
+        """ Sets the soft budget of a move, returns the hard budget for its deadline """
+        self.soft = self.min_budget + (self.soft_budget - self.min_budget) * danger(board)
+        self.last_move = None
+        self.previous_elapsed = 0.0
+        self.last_iteration = 0.0
+        return self.hard_budget
+
+    def keep_searching(self, elapsed, move):
+        """
+        Called after every finished iteration with the time spent on the move
+        so far and the iteration's best move. :return True to search deeper
+        """
+        changed = self.last_move is not None and move != self.last_move
+        self.last_move = move
+
+        # Predict the next iteration from how much the last one grew
+        iteration = elapsed - self.previous_elapsed
+        growth = iteration / self.last_iteration if self.last_iteration > 0 else DEFAULT_GROWTH
+        self.previous_elapsed = elapsed
+        self.last_iteration = iteration
+        finish = elapsed + iteration * growth
+
+        if finish <= self.soft:
+            return True
+        if changed and finish <= min(self.soft * EXTENSION, self.hard_budget):
+            self.extensions += 1
+            return True
+        if elapsed < self.soft:
+            self.early_stops += 1
+        return False
+
+    def end_move(self, elapsed, timed_out):
+        self.moves += 1
+        self.budgeted += self.soft
+        self.used += elapsed
+        self.timeouts += timed_out
+
+    def summary(self):
+        return {
+            "moves": self.moves,
+            "budget_mean": self.budgeted / self.moves if self.moves else 0.0,
+            "used_mean": self.used / self.moves if self.moves else 0.0,
+            "used_total": self.used,
+            "budget_used": self.used / self.budgeted if self.budgeted else 0.0,
+            "extensions": self.extensions,
+            "early_stops": self.early_stops,
+            "hard_timeouts": self.timeouts,
+        }
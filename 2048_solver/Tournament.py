@@ -0,0 +1,180 @@
+import argparse
+import csv
+import json
+import math
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from BaseDisplayer import BaseDisplayer
+from BitGrid import BitGrid
+from ComputerAI import ComputerAI
+from GameManager import GameManager
+from IntelligentAgent import IntelligentAgent
+
+# Headless batch runner: plays seeded games across worker processes without
+# any display output and collects per game and aggregate statistics.
+
+CSV_FIELDS = ["seed", "max_tile", "score", "moves", "timed_out", "near_alarms", "max_turn_time", "duration",
+              "latency_mean", "latency_p50", "latency_p99", "latency_max"]
+
+
+def percentile(values, p):
+    """ Nearest rank percentile of a list of numbers """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def play_game(seed, agent_kwargs=None):
+    """ Plays one game with every random choice seeded by seed and returns its statistics """
+    random.seed(seed)
+    agent = IntelligentAgent(**(agent_kwargs or {}))
+    manager = GameManager(4, agent, ComputerAI(), BaseDisplayer(), BitGrid, verbose=False)
+
+    start = time.perf_counter()
+    max_tile = manager.start()
+    duration = time.perf_counter() - start
+
+    latencies = manager.moveTimes
+    return {
+        "seed": seed,
+        "max_tile": max_tile,
+        "score": manager.getScore(),
+        "moves": manager.moves,
+        "timed_out": manager.timedOut,
+        "near_alarms": manager.nearAlarms,
+        "max_turn_time": manager.maxTurnTime,
+        "duration": duration,
+        "latency_mean": sum(latencies) / len(latencies) if latencies else 0.0,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p99": percentile(latencies, 99),
+        "latency_max": max(latencies) if latencies else 0.0,
+        "latencies": latencies,
+        "time_bank": agent.time_bank.summary() if agent.time_bank else None,
+        "position_cache_hit_rate": agent.position_cache.hitRate() if agent.position_cache is not None else None,
+    }
+
+
+def _play(task):
+    return play_game(*task)
+
+
+def run_tournament(games, seed=0, workers=None, agent_kwargs=None):
+    """
+    Plays games seeded seed, seed + 1, ... across a pool of worker processes.
+    :return (list of per game results in seed order, summary dict)
+    """
+    tasks = [(seed + i, agent_kwargs) for i in range(games)]
+    workers = workers or os.cpu_count() or 1
+    # Every game opens the shared cache, so it has to exist before they start.
+    # Opening it through an agent stamps a new file with the agent's configuration
+    if agent_kwargs and agent_kwargs.get("position_cache"):
+        IntelligentAgent(**agent_kwargs).close()
+
+    start = time.perf_counter()
+    if workers == 1:
+        results = [_play(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(_play, tasks, chunksize=max(1, games // (4 * workers))))
+    elapsed = time.perf_counter() - start
+
+    return results, summarize(results, elapsed, workers)
+
+
+def summarize(results, elapsed, workers):
+    latencies = [latency for result in results for latency in result["latencies"]]
+    scores = [result["score"] for result in results]
+    moves = [result["moves"] for result in results]
+    games = len(results)
+
+    return {
+        "games": games,
+        "workers": workers,
+        "elapsed": elapsed,
+        "games_per_second": games / elapsed if elapsed else 0.0,
+        "max_tile_distribution": {str(tile): count for tile, count in
+                                  sorted(Counter(result["max_tile"] for result in results).items())},
+        "score_mean": sum(scores) / games if games else 0.0,
+        "score_p50": percentile(scores, 50),
+        "moves_mean": sum(moves) / games if games else 0.0,
+        "moves_total": sum(moves),
+        "latency_p50": percentile(latencies, 50),
+        "latency_p90": percentile(latencies, 90),
+        "latency_p99": percentile(latencies, 99),
+        "latency_max": max(latencies) if latencies else 0.0,
+        "timeouts": sum(result["timed_out"] for result in results),
+        "near_alarms": sum(result["near_alarms"] for result in results),
+        "max_turn_time": max((result["max_turn_time"] for result in results), default=0.0),
+        "position_cache_hit_rate": _mean([result["position_cache_hit_rate"] for result in results
+                                          if result["position_cache_hit_rate"] is not None]),
+        "time_bank": _merge_time_banks([result["time_bank"] for result in results if result["time_bank"]]),
+    }
+
+
+def _mean(values):
+    return sum(values) / len(values) if values else None
+
+
+def _merge_time_banks(banks):
+    """ Adds up the TimeBank summaries of adaptive time games, None without any """
+    if not banks:
+        return None
+    moves = sum(bank["moves"] for bank in banks)
+    used = sum(bank["used_total"] for bank in banks)
+    budgeted = sum(bank["budget_mean"] * bank["moves"] for bank in banks)
+    return {
+        "moves": moves,
+        "budget_mean": budgeted / moves if moves else 0.0,
+        "used_mean": used / moves if moves else 0.0,
+        "budget_used": used / budgeted if budgeted else 0.0,
+        "extensions": sum(bank["extensions"] for bank in banks),
+        "early_stops": sum(bank["early_stops"] for bank in banks),
+        "hard_timeouts": sum(bank["hard_timeouts"] for bank in banks),
+    }
+
+
+def write_json(path, results, summary):
+    with open(path, "w") as output_file:
+        json.dump({"summary": summary,
+                   "games": [{key: result[key] for key in CSV_FIELDS} for result in results]},
+                  output_file, indent=2)
+
+
+def write_csv(path, results):
+    with open(path, "w", newline="") as output_file:
+        writer = csv.DictWriter(output_file, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play seeded 2048 games headless across worker processes")
+    parser.add_argument("-n", "--games", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--mode", choices=["minimax", "expectimax"], default="minimax")
+    parser.add_argument("--adaptive-time", action="store_true", help="budget moves with a TimeBank")
+    parser.add_argument("--position-cache", help="file of a position cache shared by all games")
+    parser.add_argument("--json", help="write the summary and per game results as JSON")
+    parser.add_argument("--csv", help="write per game results as CSV")
+    args = parser.parse_args()
+
+    agent_kwargs = {"search_mode": args.mode, "adaptive_time": args.adaptive_time,
+                    "position_cache": args.position_cache}
+    results, summary = run_tournament(args.games, args.seed, args.workers, agent_kwargs)
+
+    if args.json:
+        write_json(args.json, results, summary)
+    if args.csv:
+        write_csv(args.csv, results)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
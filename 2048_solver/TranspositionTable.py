@@ -0,0 +1,68 @@
+from collections import OrderedDict
+
+# Bound types of a stored search value
+(EXACT, LOWER, UPPER) = (0, 1, 2)
+
+# Rough size of one entry: dict slot, key, entry tuple and its float value
+ENTRY_BYTES = 200
+
+
+class TranspositionTable:
+    """
+        Bounded map from a board key to the result of searching it.
+        Each entry is a tuple (depth, value, bound, move, generation), where
+        depth is the remaining search depth the value was computed with and
+        generation counts the searches started by new_search. A new result
+        only replaces an existing one for the same board if it was searched at
+        least as deep or the existing one is from an earlier search, and the
+        least recently used board is evicted when the table is full.
+    """
+    def __init__(self, maxEntries: int=None, memoryLimitMB: float=16):
+        """
+        :param maxEntries->int : Maximum number of boards to keep
+        :param memoryLimitMB->float : Used to size the table if maxEntries is not given
+        """
+        self.maxEntries = maxEntries or max(1, int(memoryLimitMB * 2**20) // ENTRY_BYTES)
+        self.entries    = OrderedDict()
+        self.generation = 0
+        self.probes     = 0
+        self.hits       = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def lookup(self, key):
+        """ Returns the entry stored for key, or None """
+        self.probes += 1
+        entry = self.entries.get(key)
+
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+
+        return entry
+
+    def new_search(self) -> None:
+        """ Ages the stored entries, so the next search may replace them with shallower ones """
+        self.generation += 1
+
+    def store(self, key, depth: int, value: float, bound: int, move) -> None:
+        """ Stores a search result, keeping the deeper one of the same search on collisions """
+        entry = self.entries.get(key)
+
+        if entry is not None:
+            if entry[0] > depth and entry[4] == self.generation:
+                return
+            self.entries.move_to_end(key)
+        elif len(self.entries) >= self.maxEntries:
+            self.entries.popitem(last=False)
+
+        self.entries[key] = (depth, value, bound, move, self.generation)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.probes = 0
+        self.hits   = 0
+
+    def hitRate(self) -> float:
+        return self.hits / self.probes if self.probes else 0.0
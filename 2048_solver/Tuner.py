@@ -0,0 +1,125 @@
+import argparse
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from Tournament import play_game
+
+# Parallel tuning of the evaluation weights w1..w4 of IntelligentAgent by
+# successive halving: random candidates play a few seeded games, the worse
+# half is dropped, and the survivors play twice as many games, until one
+# candidate is left. Every candidate plays the same seeds so they are compared
+# on the same tile spawns. The state is checkpointed to JSON after every game
+# so an interrupted run resumes where it stopped.
+
+WEIGHT_RANGES = {
+    "w1": (0.0, 3.0),   # monotonicity
+    "w2": (0.0, 5.0),   # max tile in the corner
+    "w3": (0.0, 3.0),   # free cells
+    "w4": (0.0, 3.0),   # 2048 bonus
+}
+DEFAULT_WEIGHTS = {"w1": .5, "w2": 1, "w3": 1, "w4": 1}
+
+
+def _play(index, weights, seed, agent_kwargs):
+    result = play_game(seed, dict(agent_kwargs, **weights))
+    return index, seed, result["score"]
+
+
+class Tuner:
+    """
+        Successive halving over random weight candidates.
+        :param checkpoint->str : JSON file the search state is saved to and resumed from
+        :param candidates->int : Number of random candidates, including the current defaults
+        :param games->int : Games every candidate plays in the first round
+        :param eta->int : Only the best 1/eta candidates survive a round, and they play eta times the games
+    """
+    def __init__(self, checkpoint, candidates=32, games=4, eta=2, seed=0, workers=None, agent_kwargs=None):
+        self.checkpoint = checkpoint
+        self.workers = workers or os.cpu_count() or 1
+
+        if os.path.exists(checkpoint):
+            with open(checkpoint) as input_file:
+                self.state = json.load(input_file)
+        else:
+            rng = random.Random(seed)
+            weights = [dict(DEFAULT_WEIGHTS)]
+            while len(weights) < candidates:
+                weights.append({name: round(rng.uniform(low, high), 3)
+                                for name, (low, high) in WEIGHT_RANGES.items()})
+            self.state = {
+                "games": games,
+                "eta": eta,
+                "seed": seed,
+                "agent_kwargs": agent_kwargs or {},
+                "round": 0,
+                "candidates": [{"weights": w, "scores": {}, "alive": True} for w in weights],
+            }
+            self.save()
+
+    def save(self):
+        """ Writes the checkpoint atomically so a crash never leaves half a file """
+        temp_path = self.checkpoint + ".tmp"
+        with open(temp_path, "w") as output_file:
+            json.dump(self.state, output_file, indent=1)
+        os.replace(temp_path, self.checkpoint)
+
+    def round_seeds(self):
+        state = self.state
+        games = state["games"] * state["eta"] ** state["round"]
+        return [state["seed"] + i for i in range(games)]
+
+    def mean_score(self, candidate, seeds):
+        return sum(candidate["scores"][str(seed)] for seed in seeds) / len(seeds)
+
+    def run(self):
+        """ Runs the remaining rounds and returns the best candidate """
+        state = self.state
+
+        with ProcessPoolExecutor(self.workers) as pool:
+            while True:
+                alive = [i for i, candidate in enumerate(state["candidates"]) if candidate["alive"]]
+                if len(alive) == 1:
+                    return state["candidates"][alive[0]]
+                seeds = self.round_seeds()
+
+                # Only play the games the checkpoint has no score for
+                futures = [pool.submit(_play, i, state["candidates"][i]["weights"], seed, state["agent_kwargs"])
+                           for i in alive for seed in seeds
+                           if str(seed) not in state["candidates"][i]["scores"]]
+                for future in as_completed(futures):
+                    index, seed, score = future.result()
+                    state["candidates"][index]["scores"][str(seed)] = score
+                    self.save()
+
+                ranked = sorted(alive, key=lambda i: self.mean_score(state["candidates"][i], seeds), reverse=True)
+                print("Round %d: %d candidates, %d games each, best %s with mean score %.1f"
+                      % (state["round"], len(alive), len(seeds), state["candidates"][ranked[0]]["weights"],
+                         self.mean_score(state["candidates"][ranked[0]], seeds)))
+
+                for i in ranked[max(1, len(ranked) // state["eta"]):]:
+                    state["candidates"][i]["alive"] = False
+                state["round"] += 1
+                self.save()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune IntelligentAgent evaluation weights by successive halving")
+    parser.add_argument("checkpoint", help="JSON checkpoint, resumed if it exists")
+    parser.add_argument("--candidates", type=int, default=32)
+    parser.add_argument("--games", type=int, default=4)
+    parser.add_argument("--eta", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--mode", choices=["minimax", "expectimax"], default="minimax")
+    args = parser.parse_args()
+
+    tuner = Tuner(args.checkpoint, args.candidates, args.games, args.eta, args.seed, args.workers,
+                  {"search_mode": args.mode})
+    best = tuner.run()
+    print("Final weights: " + ",".join(str(best["weights"][name]) for name in sorted(WEIGHT_RANGES)))
+
+
+if __name__ == '__main__':
+    main()
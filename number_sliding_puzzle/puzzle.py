@@ -1,11 +1,17 @@
 from __future__ import division
 from __future__ import print_function
 
+import os
 import sys
 import math
+import mmap
+import heapq
 import time
 import queue as Q
 import resource
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
 sys.setrecursionlimit(10**6)
 class Solver(object):
@@ -36,51 +42,172 @@ class Solver(object):
     def solve(self):
         self.get_path_to_goal(self.state)
 
+# Boards are packed into one integer, 4 bits per tile up to the 15-puzzle
+# and as many as the largest tile needs beyond: the tile at index i lives in
+# bits b*i to b*i+b-1. The blank is tile 0, so moving a tile into it is an
+# addition and a subtraction on the packed board.
+TILE_BITS = 4
+
+# Actions in the order children are generated, the opposite of action a is a ^ 1
+ACTIONS = ["Up", "Down", "Left", "Right"]
+
+
+@lru_cache(maxsize=None)
+def tile_bits(n):
+    """ Bits per tile of a packed n*n board """
+    return max(TILE_BITS, (n*n - 1).bit_length())
+
+
+def pack_config(config, n):
+    """ Packs a list of tiles into an integer board """
+    bits = tile_bits(n)
+    board = 0
+    for index, num in enumerate(config):
+        board |= num << (bits * index)
+    return board
+
+
+def unpack_board(board, n):
+    """ Unpacks an integer board into a list of n*n tiles """
+    bits = tile_bits(n)
+    mask = (1 << bits) - 1
+    return [(board >> (bits * index)) & mask for index in range(n * n)]
+
+
+@lru_cache(maxsize=None)
+def goal_board(n):
+    """ Packed goal state [0, 1, ..., n*n-1] """
+    return pack_config(range(n * n), n)
+
+
+@lru_cache(maxsize=None)
+def neighbours(n):
+    """
+    For every blank index, the (action, index of the tile that slides into
+    the blank) pairs of its legal moves in UDLR order.
+    """
+    table = []
+    for blank in range(n * n):
+        row, col = divmod(blank, n)
+        moves = []
+        if row > 0:
+            moves.append((0, blank - n))
+        if row < n - 1:
+            moves.append((1, blank + n))
+        if col > 0:
+            moves.append((2, blank - 1))
+        if col < n - 1:
+            moves.append((3, blank + 1))
+        table.append(tuple(moves))
+    return table
+
+
+@lru_cache(maxsize=None)
+def manhattan_table(n):
+    """ distance[tile][index] : Manhattan distance of tile at index from its goal, 0 for the blank """
+    distance = [[0] * (n * n)]
+    for tile in range(1, n * n):
+        goal_row, goal_col = divmod(tile, n)
+        distance.append([abs(index // n - goal_row) + abs(index % n - goal_col) for index in range(n * n)])
+    return distance
+
+
+def is_solvable(config, n):
+    """ Tests whether the goal can be reached from config, using the parity of its inversions """
+    tiles = [num for num in config if num != 0]
+    inversions = sum(1 for i in range(len(tiles)) for j in range(i + 1, len(tiles)) if tiles[i] > tiles[j])
+    if n % 2 == 1:
+        return inversions % 2 == 0
+    # With an even width, every vertical move also changes the row of the blank
+    return (inversions + config.index(0) // n) % 2 == 0
+
+
 ## The Class that Represents the Puzzle
 class PuzzleState(object):
     """
         The PuzzleState stores a board configuration and implements
         movement instructions to generate valid children.
     """
-    def __init__(self, config, n, parent=None, action="Initial", cost=0):
+    __slots__ = ("n", "bits", "cost", "parent", "action", "board", "blank_index", "children",
+                 "heuristic", "hdata", "h", "f")
+
+    def __init__(self, config, n, parent=None, action="Initial", cost=0, blank_index=None):
         """
         :param config->List : Represents the n*n board, for e.g. [0,1,2,3,4,5,6,7,8] represents the goal state.
+                              Children pass the packed board as an int together with blank_index.
         :param n->int : Size of the board
         :param parent->PuzzleState
         :param action->string
         :param cost->int
+        :param blank_index->int : Index of the empty block when config is a packed board
         """
-        if n*n != len(config) or n < 2:
-            raise Exception("The length of config is not correct!")
-        if set(config) != set(range(n*n)):
-            raise Exception("Config contains invalid/duplicate entries : ", config)
+        if isinstance(config, int):
+            self.board = config
+        else:
+            if n*n != len(config) or n < 2:
+                raise Exception("The length of config is not correct!")
+            if set(config) != set(range(n*n)):
+                raise Exception("Config contains invalid/duplicate entries : ", config)
+            self.board = pack_config(config, n)
+            blank_index = config.index(0)
 
         self.n        = n
+        self.bits     = tile_bits(n)
         self.cost     = cost
         self.parent   = parent
         self.action   = action
-        self.config   = config
         self.children = []
 
-        # Get the index and (row, col) of empty block
-        self.blank_index = self.config.index(0)
+        # Get the index of empty block
+        self.blank_index = blank_index
+
+        # Estimates of informed searches, see set_heuristic
+        self.heuristic = None
+        self.hdata     = None
+        self.h         = 0
+        self.f         = cost
+
+    def set_heuristic(self, heuristic):
+        """ Evaluates this state with heuristic, its children then update h and f incrementally """
+        self.heuristic = heuristic
+        self.h, self.hdata = heuristic.initial(self.board)
+        self.f = self.cost + self.h
+
+    @property
+    def config(self):
+        """ The board as a list of tiles """
+        return unpack_board(self.board, self.n)
+
+    def slide(self, index, action):
+        """
+        Moves the tile at index into the blank.
+        :return a PuzzleState with the new configuration
+        """
+        bits = self.bits
+        tile = (self.board >> (bits * index)) & ((1 << bits) - 1)
+        board = self.board + (tile << (bits * self.blank_index)) - (tile << (bits * index))
+        child = PuzzleState(board, self.n, self, action, self.cost + 1, index)
+        if self.heuristic is not None:
+            # Only one tile moved, so only its terms of the estimate change
+            delta, child.hdata = self.heuristic.child(self.board, self.hdata, tile, index, self.blank_index)
+            child.heuristic = self.heuristic
+            child.h = self.h + delta
+            child.f = child.cost + child.h
+        return child
 
     def display(self):
         """ Display this Puzzle state as a n*n board """
+        config = self.config
         for i in range(self.n):
-            print(self.config[3*i : 3*(i+1)])
+            print(config[self.n*i : self.n*(i+1)])
 
     def move_up(self):
         """ 
         Moves the blank tile one row up.
         :return a PuzzleState with the new configuration
         """
-        if self.blank_index > 2 and self.action != "Down":
-            new_config = self.config.copy()
-            new_config[self.blank_index] = new_config[self.blank_index-3]
-            new_config[self.blank_index-3] = 0
-            new_cost = self.cost + 1
-            return PuzzleState(new_config, self.n, self,  "Up", new_cost)
+        if self.blank_index >= self.n and self.action != "Down":
+            return self.slide(self.blank_index - self.n, "Up")
 
         return None
       
@@ -89,12 +216,8 @@ class PuzzleState(object):
         Moves the blank tile one row down.
         :return a PuzzleState with the new configuration
         """
-        if self.blank_index < 6 and self.action != "Up":
-            new_config = self.config.copy()
-            new_config[self.blank_index] = new_config[self.blank_index + 3]
-            new_config[self.blank_index + 3] = 0
-            new_cost = self.cost + 1
-            return PuzzleState(new_config, self.n, self, "Down", new_cost)
+        if self.blank_index < self.n * (self.n - 1) and self.action != "Up":
+            return self.slide(self.blank_index + self.n, "Down")
 
         return None
       
@@ -103,12 +226,8 @@ class PuzzleState(object):
         Moves the blank tile one column to the left.
         :return a PuzzleState with the new configuration
         """
-        if self.blank_index % 3 != 0 and self.action != "Right":
-            new_config = self.config.copy()
-            new_config[self.blank_index] = new_config[self.blank_index - 1]
-            new_config[self.blank_index - 1] = 0
-            new_cost = self.cost + 1
-            return PuzzleState(new_config, self.n, self, "Left", new_cost)
+        if self.blank_index % self.n != 0 and self.action != "Right":
+            return self.slide(self.blank_index - 1, "Left")
 
         return None
 
@@ -117,12 +236,8 @@ class PuzzleState(object):
         Moves the blank tile one column to the right.
         :return a PuzzleState with the new configuration
         """
-        if (self.blank_index+1) % 3 != 0 and self.action != "Left":
-            new_config = self.config.copy()
-            new_config[self.blank_index] = new_config[self.blank_index + 1]
-            new_config[self.blank_index + 1] = 0
-            new_cost = self.cost + 1
-            return PuzzleState(new_config, self.n, self, "Right", new_cost)
+        if (self.blank_index+1) % self.n != 0 and self.action != "Left":
+            return self.slide(self.blank_index + 1, "Right")
 
         return None
       
@@ -145,16 +260,129 @@ class PuzzleState(object):
         return self.children
 
     def __lt__(self, other):
-        self_h = calculate_manhattan_dist(self) + self.cost
-        other_h = calculate_manhattan_dist(other) + other.cost
-        if self_h == other_h:
-            moves = ["Up", "Down", "Left", "Right"]
-            return moves.index(self.action) < moves.index(other.action)
+        """ Orders by the stored f, then by action in UDLR order """
+        if self.f == other.f:
+            return ACTIONS.index(self.action) < ACTIONS.index(other.action)
         else:
-            return self_h < other_h
+            return self.f < other.f
 
     def __eq__(self, other):
-        return "".join(str(num) for num in self.config) == "".join(str(num) for num in other.config)
+        return self.board == other.board
+
+
+# Frontiers of the searches. None of them take locks, the searches are
+# single threaded. The priority frontiers order states by (f, action order).
+# HeapFrontier queues (f, action order, state) entries like the PriorityQueue
+# it replaces, so ties fall to heapq's order exactly as before. A board
+# pushed again with a lower f replaces the queued state, and the entry of the
+# old one is skipped when it comes up (lazy deletion).
+ACTION_ORDER = {"Initial": 0, "Up": 0, "Down": 1, "Left": 2, "Right": 3}
+TIES = len(ACTIONS)
+
+
+class FifoFrontier(object):
+    """ First in, first out, for breadth first search """
+    def __init__(self):
+        self.queue = deque()
+
+    def push(self, state):
+        self.queue.append(state)
+        return True
+
+    def pop(self):
+        return self.queue.popleft()
+
+    def __len__(self):
+        return len(self.queue)
+
+
+class LifoFrontier(object):
+    """ Last in, first out, for depth first search """
+    def __init__(self):
+        self.stack = []
+
+    def push(self, state):
+        self.stack.append(state)
+        return True
+
+    def pop(self):
+        return self.stack.pop()
+
+    def __len__(self):
+        return len(self.stack)
+
+
+class HeapFrontier(object):
+    """ Binary heap of (f, action order, state) entries """
+    def __init__(self):
+        self.heap   = []
+        self.states = {}  # Packed board -> queued state
+
+    def push(self, state):
+        """ Queues state unless its board is queued with an f at most as large, :return whether it was queued """
+        queued = self.states.get(state.board)
+        if queued is not None and queued.f <= state.f:
+            return False
+        self.states[state.board] = state
+        heapq.heappush(self.heap, (state.f, ACTION_ORDER[state.action], state))
+        return True
+
+    def pop(self):
+        """ :return the queued state with the lowest key, skipping replaced entries """
+        states = self.states
+        while True:
+            state = heapq.heappop(self.heap)[2]
+            if states.get(state.board) is state:
+                del states[state.board]
+                return state
+
+    def __len__(self):
+        return len(self.states)
+
+
+class BucketFrontier(object):
+    """
+        One FIFO bucket of packed boards per (f, action order) key, for the
+        small integer f of the sliding puzzle. Pushes and pops are O(1) apart
+        from stepping over empty buckets. Ties within a key pop in insertion
+        order, not heapq's order, so node counts differ from HeapFrontier.
+    """
+    def __init__(self):
+        self.buckets = []
+        self.lowest  = 0  # No bucket below this key holds an entry
+        self.states  = {}  # Packed board -> queued state
+
+    def push(self, state):
+        """ Queues state unless its board is queued with an f at most as large, :return whether it was queued """
+        queued = self.states.get(state.board)
+        if queued is not None and queued.f <= state.f:
+            return False
+        self.states[state.board] = state
+        key = state.f * TIES + ACTION_ORDER[state.action]
+        while len(self.buckets) <= key:
+            self.buckets.append(deque())
+        self.buckets[key].append(state.board)
+        if key < self.lowest:
+            self.lowest = key
+        return True
+
+    def pop(self):
+        """ :return the queued state with the lowest key, skipping replaced entries """
+        buckets = self.buckets
+        states = self.states
+        while True:
+            bucket = buckets[self.lowest]
+            if not bucket:
+                self.lowest += 1
+                continue
+            board = bucket.popleft()
+            state = states.get(board)
+            if state is not None and state.f == self.lowest // TIES:
+                del states[board]
+                return state
+
+    def __len__(self):
+        return len(self.states)
 
 
 # Function that Writes to output.txt
@@ -185,125 +413,176 @@ def writeOutput(solver):
     output_file.write("max_ram_usage: " + max_ram + "\n")
     pass
 
-def bfs_search(initial_state):
+def bfs_search(initial_state, frontier_class=FifoFrontier):
     """BFS search"""
     start_time = time.time()
     dfs_start_ram = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
-    frontier = Q.Queue()
-    frontier.put(initial_state)
-    board = "".join(str(num) for num in initial_state.config)
+    frontier = frontier_class()
+    frontier.push(initial_state)
     frontier_set = set()
-    frontier_set.add(board)
+    frontier_set.add(initial_state.board)
     explored = set()
     nodes_expanded = 0
     max_cost = 0
 
-    while frontier.qsize() > 0:
-        state = frontier.get()
-        state_board = "".join(str(num) for num in state.config)
+    while len(frontier) > 0:
+        state = frontier.pop()
+        state_board = state.board
         frontier_set.remove(state_board)
         explored.add(state_board)
 
         # if find end goal state
-        if test_end_goal(state, nodes_expanded, max_cost, dfs_start_ram, start_time):
-            return
+        solver = test_end_goal(state, nodes_expanded, max_cost, dfs_start_ram, start_time)
+        if solver:
+            return solver
 
         nodes_expanded += 1
         for child in state.expand():
-            child_board = "".join(str(num) for num in child.config)
+            child_board = child.board
             if child_board not in frontier_set and child_board not in explored:
                 if child.cost > max_cost:
                     max_cost = child.cost
-                frontier.put(child)
+                frontier.push(child)
                 frontier_set.add(child_board)
 
-    return
+    return None
 
-def dfs_search(initial_state):
+def dfs_search(initial_state, frontier_class=LifoFrontier):
     """DFS search"""
     start_time = time.time()
     dfs_start_ram = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
-    frontier = [initial_state]
-    board = "".join(str(num) for num in initial_state.config)
+    frontier = frontier_class()
+    frontier.push(initial_state)
     frontier_set = set()
-    frontier_set.add(board)
+    frontier_set.add(initial_state.board)
     explored = set()
     nodes_expanded = 0
     max_search_depth = 0
 
     while len(frontier) > 0:
         state = frontier.pop()
-        state_board = "".join(str(num) for num in state.config)
+        state_board = state.board
         frontier_set.remove(state_board)
 
         explored.add(state_board)
 
-        if test_end_goal(state, nodes_expanded, max_search_depth, dfs_start_ram, start_time):
-            return
+        solver = test_end_goal(state, nodes_expanded, max_search_depth, dfs_start_ram, start_time)
+        if solver:
+            return solver
 
         expanded = state.expand()
         expanded.reverse()
         nodes_expanded += 1
         for child in expanded:
-            child_board = "".join(str(num) for num in child.config)
+            child_board = child.board
             if child_board not in frontier_set and child_board not in explored:
                 if child.cost > max_search_depth:
                     max_search_depth = child.cost
-                frontier.append(child)
+                frontier.push(child)
                 frontier_set.add(child_board)
 
-    return
+    return None
 
-def A_star_search(initial_state):
-    """A * search"""
+def A_star_search(initial_state, heuristic=None, frontier_class=HeapFrontier):
+    """A * search, with the Manhattan distance unless another heuristic is given"""
     start_time = time.time()
     dfs_start_ram = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
-    frontier = Q.PriorityQueue()
-    frontier.put(initial_state)
-
-    initial_board = "".join(str(num) for num in initial_state.config)
-    mhd_initial_state = calculate_manhattan_dist(initial_state)
-    frontier_to_cost_map = {initial_board: mhd_initial_state}
+    if heuristic is None:
+        heuristic = ManhattanHeuristic(initial_state.n)
+    # Children inherit the heuristic and keep their h and f up to date
+    initial_state.set_heuristic(heuristic)
+    # The frontier keeps the best queued state of every board
+    frontier = frontier_class()
+    frontier.push(initial_state)
     explored = set()
     nodes_expanded = 0
     max_search_depth = 0
 
-    while frontier.qsize() > 0:
-        state = frontier.get()
-        state_board = "".join(str(num) for num in state.config)
-        if state_board not in explored:
-            explored.add(state_board)
-
-            if test_end_goal(state, nodes_expanded, max_search_depth, dfs_start_ram, start_time):
-                return
-
-            nodes_expanded += 1
-            for child in state.expand():
-                child_board = "".join(str(num) for num in child.config)
-                child_h = calculate_manhattan_dist(child) + child.cost
-                if child_board not in frontier_to_cost_map.keys() and child_board not in explored:
-                    if child.cost > max_search_depth:
-                        max_search_depth = child.cost
-                    frontier.put(child)
-                    frontier_to_cost_map[child_board] = child_h
-                elif child_board in frontier_to_cost_map.keys():
-                    if child_h < frontier_to_cost_map.get(child_board):
-                        frontier.put(child)
-                        frontier_to_cost_map[child_board] = child_h
-        explored.add(state_board)
+    while len(frontier) > 0:
+        state = frontier.pop()
+        explored.add(state.board)
+
+        solver = test_end_goal(state, nodes_expanded, max_search_depth, dfs_start_ram, start_time)
+        if solver:
+            return solver
+
+        nodes_expanded += 1
+        for child in state.expand():
+            if child.board not in explored and frontier.push(child):
+                if child.cost > max_search_depth:
+                    max_search_depth = child.cost
+
+    return None
+
+def ida_search(initial_state, heuristic=None):
+    """IDA * search, with the Manhattan distance unless another heuristic is given"""
+    start_time = time.time()
+    dfs_start_ram = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if not is_solvable(initial_state.config, initial_state.n):
+        return None
 
-    return
+    n = initial_state.n
+    bits = initial_state.bits
+    mask = (1 << bits) - 1
+    goal = goal_board(n)
+    moves = neighbours(n)
+    if heuristic is None:
+        heuristic = ManhattanHeuristic(n)
+    move_tile = heuristic.move
+    # The only memory is the current path, moves are made on plain integers
+    path = []
+    stats = [0, 0]  # nodes expanded, max search depth
+
+    def search(board, blank, cost, h, bound, last_action):
+        """ Depth first search below bound, :return None when the goal is found, else the smallest f over bound """
+        f = cost + h
+        if f > bound:
+            return f
+        if board == goal:
+            return None
+
+        stats[0] += 1
+        if cost + 1 > stats[1]:
+            stats[1] = cost + 1
+        minimum = math.inf
+        for action, index in moves[blank]:
+            if action ^ 1 == last_action:
+                continue
+            tile = (board >> (bits * index)) & mask
+            child_h = h + move_tile(board, tile, index, blank)
+            child = board + (tile << (bits * blank)) - (tile << (bits * index))
+            path.append((action, index))
+            result = search(child, index, cost + 1, child_h, bound, action)
+            if result is None:
+                return None
+            path.pop()
+            move_tile(child, tile, blank, index)
+            if result < minimum:
+                minimum = result
+        return minimum
+
+    h = heuristic.start(initial_state.board)
+    bound = h
+    while bound is not None:
+        bound = search(initial_state.board, initial_state.blank_index, 0, h, bound, None)
+
+    # Rebuild the solution as PuzzleStates for the Solver
+    state = initial_state
+    for action, index in path:
+        state = state.slide(index, ACTIONS[action])
+    return test_end_goal(state, stats[0], stats[1], dfs_start_ram, start_time)
 
 def test_end_goal(state, nodes_expanded, max_search_depth, dfs_start_ram, start_time):
+    """ Writes the output if state is the goal, :return its Solver or None """
     if test_goal(state):
         end_time = time.time()
         dfs_ram = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - dfs_start_ram) / (2 ** 20)
         solver = Solver(state, nodes_expanded, max_search_depth, end_time - start_time, dfs_ram)
         solver.solve()
         writeOutput(solver)
-        return True
+        return solver
 
-    return False
+    return None
 
 def calculate_total_cost(state):
     """calculate the total estimated cost of a state"""
@@ -311,25 +590,379 @@ def calculate_total_cost(state):
 
 def calculate_manhattan_dist(state):
     """calculate the manhattan distance of a state"""
+    distance = manhattan_table(state.n)
+    bits = state.bits
+    mask = (1 << bits) - 1
     mhd = 0
-    index = 0
-    while index < 9:
-        if state.config[index] != 0:
-            difference = abs(state.config[index] - index)
-            mhd += (difference % 3)
-            mhd += (difference//3)
-        index += 1
+    board = state.board
+    for index in range(state.n * state.n):
+        mhd += distance[board & mask][index]
+        board >>= bits
 
     return mhd
 
+@lru_cache(maxsize=None)
+def board_lines(n):
+    """ The cells of every row, then of every column """
+    return ([tuple(range(row * n, (row + 1) * n)) for row in range(n)] +
+            [tuple(range(col, n * n, n)) for col in range(n)])
+
+
+@lru_cache(maxsize=None)
+def line_conflicts(goals):
+    """
+    :param goals->tuple : Goal offsets along a line of the tiles that belong to it, in their current order
+    :return 2 for every tile that has to leave the line so the others can pass each other
+    """
+    # The tiles that stay form the longest increasing subsequence
+    longest = [1] * len(goals)
+    for i in range(len(goals)):
+        for j in range(i):
+            if goals[j] < goals[i] and longest[j] + 1 > longest[i]:
+                longest[i] = longest[j] + 1
+    return 2 * (len(goals) - max(longest, default=0))
+
+
+class ManhattanHeuristic(object):
+    """
+        Sum of the Manhattan distances of the tiles from their goal cells,
+        optionally plus their linear conflicts. Heuristics evaluate packed
+        boards. PuzzleStates keep their estimate with initial() and child(),
+        and searches that make moves in place use start() and move(). Both
+        only look at the terms of the tile that moves.
+    """
+    def __init__(self, n, linear_conflict=False):
+        """
+        :param n->int : Size of the board
+        :param linear_conflict->bool : Add 2 moves per tile that has to leave its goal row or column to let
+                                       another tile of that line pass
+        """
+        self.n               = n
+        self.bits            = tile_bits(n)
+        self.distance        = manhattan_table(n)
+        self.linear_conflict = linear_conflict
+        self.lines           = board_lines(n)
+
+    def conflicts(self, board, line):
+        """ Linear conflicts of a line, rows are lines 0 to n-1 and columns n to 2n-1 """
+        n = self.n
+        bits = self.bits
+        mask = (1 << bits) - 1
+        goals = []
+        for cell in self.lines[line]:
+            tile = (board >> (bits * cell)) & mask
+            if tile == 0:
+                continue
+            if line < n:
+                if tile // n == line:
+                    goals.append(tile % n)
+            elif tile % n == line - n:
+                goals.append(tile // n)
+        return line_conflicts(tuple(goals))
+
+    def evaluate(self, board):
+        """ :return the estimate of board """
+        distance = self.distance
+        mask = (1 << self.bits) - 1
+        h = 0
+        rest = board
+        for index in range(self.n * self.n):
+            h += distance[rest & mask][index]
+            rest >>= self.bits
+        if self.linear_conflict:
+            h += sum(self.conflicts(board, line) for line in range(2 * self.n))
+        return h
+
+    def initial(self, board):
+        """ :return (estimate, data of the estimate to pass to child) of a state's board """
+        return self.evaluate(board), None
+
+    def child(self, board, data, tile, source, target):
+        """ :return (change of the estimate, data of the child) when tile slides from source to target on board """
+        return self.move(board, tile, source, target), None
+
+    def start(self, board):
+        """ Starts tracking board, :return its estimate """
+        return self.evaluate(board)
+
+    def move(self, board, tile, source, target):
+        """ Tracks tile sliding from source to target on board, :return the change of the estimate """
+        distance = self.distance[tile]
+        delta = distance[target] - distance[source]
+        if self.linear_conflict:
+            # A vertical move changes the rows the tile leaves and enters, a horizontal move the columns.
+            # The order of tiles along the other line stays the same
+            n = self.n
+            if abs(target - source) == n:
+                lines = (source // n, target // n)
+            else:
+                lines = (n + source % n, n + target % n)
+            after = board + (tile << (self.bits * target)) - (tile << (self.bits * source))
+            for line in lines:
+                delta += self.conflicts(after, line) - self.conflicts(board, line)
+        return delta
+
+
+# Additive pattern databases. The tiles are split into disjoint patterns,
+# and the database of a pattern holds the fewest moves of its own tiles that
+# bring them home from every placement, wherever the other tiles are. Moves
+# of other tiles are free, so the databases of a partition add up to an
+# admissible estimate. A placement is indexed by the cells of the pattern
+# tiles, position_bits(n) bits each in pattern order.
+PDB_MAGIC = b"PDB1"
+PDB_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PATTERNS = {
+    3: ((1, 2, 4, 5), (3, 6, 7, 8)),
+    4: ((1, 2, 3, 6, 7), (4, 5, 8, 9, 12), (10, 11, 13, 14, 15)),
+}
+UNREACHED = 0xFF
+
+
+@lru_cache(maxsize=None)
+def position_bits(n):
+    """ Bits of a cell index of an n*n board """
+    return (n*n - 1).bit_length()
+
+
+def build_pattern_database(n, tiles):
+    """
+    Retrograde breadth first search from the goal over the cells of the
+    pattern tiles and the blank. The blank moves through other tiles for free,
+    so every layer is closed over free moves before the next one starts.
+    :return bytearray indexed by placement, the distances of the pattern tiles
+    """
+    p = position_bits(n)
+    cell_mask = (1 << p) - 1
+    moves = neighbours(n)
+    table = bytearray([UNREACHED]) * (1 << (p * len(tiles)))
+    seen = bytearray(len(table) << p)
+
+    # A state is its placement index followed by the cell of the blank
+    goal = sum(tile << (p * slot) for slot, tile in enumerate(tiles))
+    frontier = [goal << p]
+    depth = 0
+    while frontier:
+        next_frontier = []
+        stack = frontier
+        while stack:
+            state = stack.pop()
+            if seen[state]:
+                continue
+            seen[state] = 1
+            index = state >> p
+            blank = state & cell_mask
+            if table[index] == UNREACHED:
+                table[index] = depth
+
+            occupied = {}
+            cells = index
+            for slot in range(len(tiles)):
+                occupied[cells & cell_mask] = slot
+                cells >>= p
+            for action, cell in moves[blank]:
+                slot = occupied.get(cell)
+                if slot is None:
+                    child = (index << p) | cell
+                    if not seen[child]:
+                        stack.append(child)
+                else:
+                    # The pattern tile at cell slides into the blank
+                    child = ((index + ((blank - cell) << (p * slot))) << p) | cell
+                    if not seen[child]:
+                        next_frontier.append(child)
+        frontier = next_frontier
+        depth += 1
+    return table
+
+
+def pattern_database_path(n, tiles, directory=None):
+    name = "pdb_%dx%d_%s.bin" % (n, n, "-".join(str(tile) for tile in tiles))
+    return os.path.join(directory or PDB_DIRECTORY, name)
+
+
+def load_pattern_database(n, tiles, directory=None, verbose=False):
+    """
+    Memory-maps the database of a pattern, building and saving it first if
+    there is no file yet. :return a read-only memoryview indexed by placement
+    :param verbose->bool : Print a line before building a missing database
+    """
+    path = pattern_database_path(n, tiles, directory)
+    header = PDB_MAGIC + bytes([n, len(tiles)]) + bytes(tiles)
+    if not os.path.exists(path):
+        if verbose:
+            print("Building pattern database %s" % os.path.basename(path))
+        table = build_pattern_database(n, tiles)
+        # Written under another name first, so a half written file is never mapped
+        with open(path + ".tmp", "wb") as output_file:
+            output_file.write(header)
+            output_file.write(table)
+        os.replace(path + ".tmp", path)
+
+    with open(path, "rb") as input_file:
+        data = mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+    if data[:len(header)] != header:
+        data.close()
+        raise Exception("%s is not the pattern database of %s" % (path, tiles))
+    return memoryview(data)[len(header):]
+
+
+class PatternDatabaseHeuristic(object):
+    """
+        Sum of additive pattern databases. Moves in place only touch the
+        placement index of the moving tile's pattern.
+    """
+    def __init__(self, n, patterns=None, directory=None, verbose=False):
+        """
+        :param n->int : Size of the board
+        :param patterns->List : Disjoint tuples of tiles, the default partition of the size if None
+        :param directory->string : Where the database files are kept, next to this file if None
+        :param verbose->bool : Announce databases that have to be built first
+        """
+        if patterns is None:
+            if n not in DEFAULT_PATTERNS:
+                raise Exception("No default pattern partition for %dx%d boards" % (n, n))
+            patterns = DEFAULT_PATTERNS[n]
+        tiles = [tile for pattern in patterns for tile in pattern]
+        if len(tiles) != len(set(tiles)) or not set(tiles) <= set(range(1, n*n)):
+            raise Exception("Patterns must be disjoint sets of tiles : ", patterns)
+
+        self.n        = n
+        self.bits     = tile_bits(n)
+        self.patterns = patterns
+        self.tables   = [load_pattern_database(n, pattern, directory, verbose) for pattern in patterns]
+        # For every tile its pattern and the shift of its cell in the placement index
+        p = position_bits(n)
+        self.slots = [None] * (n * n)
+        for number, pattern in enumerate(patterns):
+            for slot, tile in enumerate(pattern):
+                self.slots[tile] = (number, p * slot)
+        self.indices = [0] * len(patterns)
+
+    def initial(self, board):
+        """ :return (estimate, placement indices) of a state's board """
+        indices = self.placements(board)
+        return sum(table[index] for table, index in zip(self.tables, indices)), tuple(indices)
+
+    def child(self, board, data, tile, source, target):
+        """ :return (change of the estimate, placement indices of the child) when tile slides from source to target """
+        slot = self.slots[tile]
+        if slot is None:
+            return 0, data
+        number, shift = slot
+        old = data[number]
+        new = old + ((target - source) << shift)
+        table = self.tables[number]
+        return table[new] - table[old], data[:number] + (new,) + data[number + 1:]
+
+    def placements(self, board):
+        """ :return the placement index of every pattern on board """
+        indices = [0] * len(self.patterns)
+        mask = (1 << self.bits) - 1
+        for index in range(self.n * self.n):
+            slot = self.slots[(board >> (self.bits * index)) & mask]
+            if slot is not None:
+                indices[slot[0]] += index << slot[1]
+        return indices
+
+    def evaluate(self, board):
+        """ :return the estimate of board """
+        return sum(table[index] for table, index in zip(self.tables, self.placements(board)))
+
+    def start(self, board):
+        """ Starts tracking board, :return its estimate """
+        self.indices = self.placements(board)
+        return sum(table[index] for table, index in zip(self.tables, self.indices))
+
+    def move(self, board, tile, source, target):
+        """ Tracks tile sliding from source to target on board, :return the change of the estimate """
+        slot = self.slots[tile]
+        if slot is None:
+            return 0
+        number, shift = slot
+        old = self.indices[number]
+        new = old + ((target - source) << shift)
+        self.indices[number] = new
+        table = self.tables[number]
+        return table[new] - table[old]
+
+
+def make_heuristic(name, n, verbose=False):
+    """ Heuristic of the informed searches by its command line name """
+    if name == "manhattan":
+        return ManhattanHeuristic(n)
+    if name == "lc":
+        return ManhattanHeuristic(n, linear_conflict=True)
+    if name == "pdb":
+        return PatternDatabaseHeuristic(n, verbose=verbose)
+    raise Exception("Unknown heuristic : " + name)
+
 def test_goal(puzzle_state):
     """test the state is the goal state or not"""
-    index = 0
-    for num in puzzle_state.config:
-        if index != num:
+    return puzzle_state.board == goal_board(puzzle_state.n)
+
+class SynchronizedFifoFrontier(FifoFrontier):
+    """ FifoFrontier on queue.Queue, which locks on every call, only kept to benchmark against """
+    def __init__(self):
+        self.queue = Q.Queue()
+
+    def push(self, state):
+        self.queue.put(state)
+        return True
+
+    def pop(self):
+        return self.queue.get()
+
+    def __len__(self):
+        return self.queue.qsize()
+
+
+class SynchronizedHeapFrontier(HeapFrontier):
+    """ HeapFrontier on queue.PriorityQueue, which locks on every call, only kept to benchmark against """
+    def __init__(self):
+        HeapFrontier.__init__(self)
+        self.queue = Q.PriorityQueue()
+
+    def push(self, state):
+        queued = self.states.get(state.board)
+        if queued is not None and queued.f <= state.f:
             return False
-        index += 1
-    return True
+        self.states[state.board] = state
+        self.queue.put((state.f, ACTION_ORDER[state.action], state))
+        return True
+
+    def pop(self):
+        while True:
+            state = self.queue.get()[2]
+            if self.states.get(state.board) is state:
+                del self.states[state.board]
+                return state
+
+
+def benchmark_run(config, search_mode, frontier_name, heuristic_name):
+    """ One benchmark search, :return (nodes expanded, running time) """
+    n = int(math.sqrt(len(config)))
+    state = PuzzleState(config, n)
+    frontier_class = globals()[frontier_name]
+    if search_mode == "ast":
+        solver = A_star_search(state, make_heuristic(heuristic_name, n), frontier_class)
+    else:
+        solver = bfs_search(state, frontier_class)
+    return solver.nodes_expanded, solver.running_time
+
+
+def benchmark_frontiers(config, heuristic_name="manhattan"):
+    """ Solves config with every frontier of BFS (3x3 only) and A*, prints the nodes expanded per second """
+    runs = [("ast", name) for name in ("SynchronizedHeapFrontier", "HeapFrontier", "BucketFrontier")]
+    if len(config) == 9:
+        runs = [("bfs", name) for name in ("SynchronizedFifoFrontier", "FifoFrontier")] + runs
+
+    for search_mode, frontier_name in runs:
+        # Every run gets a fresh process, so no run pays for the garbage of the one before
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            nodes, seconds = pool.submit(benchmark_run, config, search_mode, frontier_name, heuristic_name).result()
+        print("%s %-24s %8d nodes %8.3f s %10.0f nodes/s" % (
+            search_mode, frontier_name, nodes, seconds, nodes / max(seconds, 1e-9)))
+
 
 # Main Function that reads in Input and Runs corresponding Algorithm
 def main():
@@ -338,11 +971,15 @@ def main():
     begin_state = list(map(int, begin_state))
     board_size  = int(math.sqrt(len(begin_state)))
     hard_state  = PuzzleState(begin_state, board_size)
+    # Informed searches take an optional heuristic: manhattan (default), lc (with linear conflicts) or pdb
+    heuristic   = make_heuristic(sys.argv[3].lower(), board_size, verbose=True) if len(sys.argv) > 3 else None
     start_time  = time.time()
 
     if   search_mode == "bfs": bfs_search(hard_state)
     elif search_mode == "dfs": dfs_search(hard_state)
-    elif search_mode == "ast": A_star_search(hard_state)
+    elif search_mode == "ast": A_star_search(hard_state, heuristic)
+    elif search_mode == "ida": ida_search(hard_state, heuristic)
+    elif search_mode == "bench": benchmark_frontiers(begin_state, sys.argv[3].lower() if len(sys.argv) > 3 else "manhattan")
     else:
         print("Enter valid command arguments !")
         